@@ -1,27 +1,17 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for
-import threading
+from flask import Flask, Response, render_template, request, send_file, redirect, url_for, jsonify, stream_with_context
+import json
 import os
-from generateYearBook import YearBook
-
-progress_thread = None
+from jobs import JobManager, QueueFull, DONE
 
 app = Flask(__name__)
 
-class ProgressThread(threading.Thread):
-    def __init__(self, email, password, **kwargs):
-        self.progress = 0
-        self.email = email
-        self.password = password
-        self.kwargs = kwargs
-        super().__init__()
-
-    def run(self):
-        self.yb = YearBook(self.email, self.password, **self.kwargs)
-        self.maxProg = len(self.yb.messagesForYou) + len(self.yb.messagesByYou)
-        def update_progress(current):
-            self.progress = int((current / self.maxProg) * 100)
-        self.yb.set_progress_callback(update_progress)
-        self.yb.generate_pdf("yearbook.pdf")
+jobs = JobManager(
+    output_dir=os.environ.get("YEARBOOK_OUTPUT_DIR", "output"),
+    workers=int(os.environ.get("YEARBOOK_WORKERS", 4)),
+    max_pending=int(os.environ.get("YEARBOOK_MAX_PENDING", 500)),
+    ttl=float(os.environ.get("YEARBOOK_JOB_TTL", 3600)),
+    profile=os.environ.get("YEARBOOK_PROFILE") or None,
+)
 
 @app.route('/')
 def home():
@@ -30,27 +20,29 @@ def home():
 @app.route('/process', methods=['POST', 'GET'])
 def process():
     if request.method == 'POST':
-        global progress_thread
         email = request.form['email']
         password = request.form['password']
         include_friends = 'friends' in request.form
         dark_mode = 'dark_mode' in request.form
-        progress_thread = ProgressThread(
-            email=email,
-            password=password,
-            include_friends=include_friends,
-            dark_mode=dark_mode
-        )
-        progress_thread.start()
-        return render_template("progress.html")
+        try:
+            job = jobs.submit(
+                email=email,
+                password=password,
+                include_friends=include_friends,
+                dark_mode=dark_mode
+            )
+        except QueueFull as e:
+            return str(e), 503
+        return render_template("progress.html", job_id=job.id)
     else:
         return redirect(url_for('home'))
 
-@app.route('/download', methods=['GET'])
-def download():
-    if os.path.exists("yearbook.pdf"):
+@app.route('/download/<job_id>', methods=['GET'])
+def download(job_id):
+    job = jobs.get(job_id)
+    if job is not None and job.state == DONE and os.path.exists(job.output_path):
         return send_file(
-            'yearbook.pdf',
+            os.path.abspath(job.output_path),
             as_attachment=True,
             download_name="yearbook.pdf",
             mimetype='application/pdf'
@@ -58,13 +50,50 @@ def download():
     else:
         return "Yearbook is not generated yet", 404
 
-@app.route('/progress', methods=['GET'])
-def progress():
-    global progress_thread
-    if progress_thread is not None:
-        return str(int(progress_thread.progress)), 200
+@app.route('/progress/<job_id>', methods=['GET'])
+def progress(job_id):
+    job = jobs.get(job_id)
+    if job is not None:
+        return jsonify(job.to_dict()), 200
+    else:
+        return "Yearbook generation not started", 404
+
+@app.route('/report/<job_id>', methods=['GET'])
+def report(job_id):
+    """Where the time of a finished job went, see ``YearBook.report``."""
+    job = jobs.get(job_id)
+    if job is not None and job.report is not None:
+        return jsonify(job.report), 200
     else:
+        return "Yearbook is not generated yet", 404
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(jobs.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/events/<job_id>', methods=['GET'])
+def events(job_id):
+    """Server-sent events with the job's phase, counts and ETA, pushed whenever they change."""
+    job = jobs.get(job_id)
+    if job is None:
         return "Yearbook generation not started", 404
 
+    def stream():
+        version = None
+        while True:
+            state = job.tracker.wait(version, timeout=15)
+            if state["version"] == version and not job.finished:
+                # nothing happened, keep proxies from closing the connection
+                yield ": keepalive\n\n"
+                continue
+            version = state["version"]
+            state.update(job.to_dict())
+            yield f"data: {json.dumps(state)}\n\n"
+            if job.finished:
+                return
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == '__main__':
-	app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
+	app.run(host='0.0.0.0', port=8000, threaded=True)
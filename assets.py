@@ -0,0 +1,154 @@
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from weakref import WeakKeyDictionary
+from imaging import SharedImageReader
+import os
+import threading
+import time
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_NAME = "Symbola"
+
+class Assets:
+    """Font and cover artwork shared by every yearbook rendered in this process.
+
+    The font is parsed and registered with reportlab once, and the cover
+    background and logo are decoded once into readers every canvas can draw
+    concurrently. reportlab embeds only the glyphs a document uses; a book
+    saved as one document per section shares one subset between them through
+    ``font_subsets``, so the merged book embeds each glyph once.
+    """
+
+    def __init__(self, asset_dir=ASSET_DIR):
+        """Load everything, see ``get_assets`` for the shared instance.
+
+        Args:
+            asset_dir (str): Directory holding Symbola.ttf, iitb_bg.jpg and iitb-logo.png
+        """
+        started = time.perf_counter()
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(SharedSubsetFont(FONT_NAME, os.path.join(asset_dir, "Symbola.ttf")))
+        self.font = pdfmetrics.getFont(FONT_NAME)
+        self.font_name = FONT_NAME
+        self.background = _load_image(os.path.join(asset_dir, "iitb_bg.jpg"))
+        self.logo = _load_image(os.path.join(asset_dir, "iitb-logo.png"))
+        self.load_seconds = time.perf_counter() - started
+
+    def font_subsets(self, text=""):
+        """A new ``FontSubsets`` of the font, see ``SharedSubsetFont``.
+
+        Args:
+            text (str): Text the subsets are built for up front, e.g. every message of the book
+        """
+        subsets = FontSubsets(self.font)
+        subsets.add(text)
+        return subsets
+
+class SharedSubsetFont(TTFont):
+    """A TrueType font whose glyph subsets can be shared by several documents.
+
+    reportlab numbers the glyphs of every document in the order they are
+    first drawn, so two sections saved as separate PDFs embed two different
+    subsets of the same font. Documents bound to one ``FontSubsets`` with
+    ``share`` use its numbering instead: the subsets they embed are the same
+    or one extends the other, and ``fragments.FragmentMerger`` keeps one of
+    them. Other documents get reportlab's own numbering.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shared = WeakKeyDictionary()  # document -> FontSubsets
+
+    def share(self, doc, subsets):
+        """Number the glyphs of ``doc`` (a canvas' ``_doc``) with ``subsets``."""
+        self._shared[doc] = subsets
+
+    def splitString(self, text, doc, encoding="utf-8"):
+        subsets = self._bind(doc)
+        if subsets is None:
+            return super().splitString(text, doc, encoding)
+        with subsets.lock:
+            return super().splitString(text, doc, encoding)
+
+    def getSubsetInternalName(self, subset, doc):
+        self._bind(doc)
+        return super().getSubsetInternalName(subset, doc)
+
+    def addObjects(self, doc):
+        subsets = self._bind(doc)
+        if subsets is None:
+            return super().addObjects(doc)
+        with subsets.lock:
+            return super().addObjects(doc)
+
+    def _bind(self, doc):
+        """The ``FontSubsets`` of ``doc``, after giving the document a state that uses it."""
+        subsets = self._shared.get(doc)
+        if subsets is not None and doc not in self.state:
+            self.state[doc] = _SharedState(subsets)
+        return subsets
+
+class FontSubsets:
+    """One numbering of the glyphs of a ``SharedSubsetFont``, shared by every document bound to it.
+
+    Glyphs keep the code they were first given, so the subsets only ever
+    grow. Building them up front from the text of the whole book makes every
+    document embed exactly the same subsets, even in other processes.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.lock = threading.Lock()
+        state = TTFont.State(font._asciiReadable, font)
+        self.assignments = state.assignments
+        self.subsets = state.subsets
+        self.next_code = state.nextCode
+
+    def add(self, text):
+        """Give every character of ``text`` that has no code yet the next one, in code point order."""
+        doc = _Unsaved()
+        self.font.share(doc, self)
+        self.font.splitString("".join(sorted(set(text))), doc)
+        del self.font.state[doc]
+
+class _SharedState(TTFont.State):
+    """reportlab's per-document font state, numbering glyphs with a ``FontSubsets``."""
+
+    def __init__(self, subsets):
+        self._subsets = subsets
+        self.assignments = subsets.assignments
+        self.subsets = subsets.subsets
+        self.internalName = None
+        self.frozen = 0
+
+    @property
+    def nextCode(self):
+        return self._subsets.next_code
+
+    @nextCode.setter
+    def nextCode(self, value):
+        self._subsets.next_code = value
+
+class _Unsaved:
+    """Stands in for a document while ``FontSubsets.add`` numbers glyphs, never saved."""
+
+_assets = None
+_assets_lock = threading.Lock()
+
+def get_assets(metrics=None):
+    """The process-wide ``Assets``, loaded by whichever yearbook needs them first.
+
+    Args:
+        metrics (Metrics): Records the load as one call of the ``assets`` phase if this call loads them
+    """
+    global _assets
+    with _assets_lock:
+        if _assets is None:
+            _assets = Assets()
+            if metrics is not None:
+                metrics.observe("assets", _assets.load_seconds)
+        return _assets
+
+def _load_image(path):
+    with open(path, "rb") as f:
+        return SharedImageReader(f.read())
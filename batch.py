@@ -0,0 +1,174 @@
+from cache import ImageCache, DEFAULT_CACHE_DIR
+from imaging import DEFAULT_DPI, DEFAULT_QUALITY
+from jobs import JobManager, DONE
+from posts import PostStore
+from tqdm import tqdm
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+
+TRUE_VALUES = ("1", "true", "yes", "y", "on")
+
+def read_accounts(path, friends=False, dark=False, depth=1, max_friends=None):
+    """Read the accounts of a batch from a CSV file.
+
+    The file needs a ``username`` (or ``email``) and a ``password`` column.
+    The optional columns ``friends``, ``dark`` (yes/no), ``depth``,
+    ``max_friends`` and ``output`` (PDF path, relative to the output
+    directory) override the defaults for their account; empty cells keep the
+    defaults.
+
+    Args:
+        path (str): CSV file with a header row
+        friends (bool): Default for the ``friends`` column
+        dark (bool): Default for the ``dark`` column
+        depth (int): Default for the ``depth`` column
+        max_friends (int): Default for the ``max_friends`` column, None for no limit
+
+    Returns:
+        list: One dict per account with ``username``, ``password``, ``output`` and the ``YearBook`` ``options``
+
+    Raises:
+        ValueError: If a column is missing or a cell cannot be parsed
+    """
+    accounts = []
+    outputs = set()
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+        username_column = columns.get("username", columns.get("email"))
+        if username_column is None or "password" not in columns:
+            raise ValueError(f"{path} needs a username (or email) and a password column")
+
+        for line, row in enumerate(reader, start=2):
+            cell = lambda name: (row.get(columns.get(name)) or "").strip()
+            username = cell("username") if "username" in columns else cell("email")
+            if not username:
+                continue
+            try:
+                options = {
+                    "include_friends": cell("friends").lower() in TRUE_VALUES if cell("friends") else friends,
+                    "dark_mode": cell("dark").lower() in TRUE_VALUES if cell("dark") else dark,
+                    "friend_depth": int(cell("depth")) if cell("depth") else depth,
+                    "max_friends": int(cell("max_friends")) if cell("max_friends") else max_friends,
+                }
+            except ValueError as e:
+                raise ValueError(f"{path}, line {line}: {e}")
+
+            output = cell("output") or _output_name(username, outputs)
+            outputs.add(output)
+            accounts.append({"username": username, "password": row[columns["password"]], "output": output, "options": options})
+    return accounts
+
+def run_batch(accounts, output_dir, jobs=4, workers=8, image_cache=None, image_dpi=DEFAULT_DPI, image_quality=DEFAULT_QUALITY,
+              transport_factory=None):
+    """Generate the yearbooks of many accounts on one worker pool.
+
+    Every account is a job of a ``JobManager``, so at most ``jobs`` yearbooks
+    are fetched and rendered at once. All of them share one image cache, one
+    post store and the font and cover artwork: classmates write to each
+    other, so most profile pictures are downloaded once for the whole batch
+    and a friend crawled for one account is not fetched again for the next.
+
+    Args:
+        accounts (list): Accounts as returned by ``read_accounts``
+        output_dir (str): Directory the PDFs are written to
+        jobs (int): Number of yearbooks generated concurrently
+        workers (int): Number of concurrent requests per yearbook
+        image_cache (ImageCache): Cache shared by every account, a default on-disk one is used if None
+        image_dpi (float): Resolution images are downscaled to, None embeds the originals
+        image_quality (int): JPEG quality of downscaled images
+        transport_factory (callable): Returns a fresh ``Transport`` for each account, the default one is used if None
+
+    Returns:
+        dict: Summary of the batch, with a result per account in ``results``
+    """
+    posts = PostStore()
+    manager = JobManager(output_dir=output_dir, workers=jobs, max_pending=max(len(accounts), 1), ttl=float("inf"),
+                         image_cache=image_cache)
+    started = time.perf_counter()
+
+    submitted = []
+    for account in accounts:
+        options = dict(account["options"], workers=workers, image_dpi=image_dpi, image_quality=image_quality, post_store=posts)
+        if transport_factory is not None:
+            options["transport"] = transport_factory()
+        output_path = os.path.join(output_dir, account["output"])
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        submitted.append((account, manager.submit(account["username"], account["password"], output_path=output_path, **options)))
+
+    results = []
+    with tqdm(total=len(submitted), desc="Accounts", unit="account") as bar:
+        for account, job in submitted:
+            job.wait()
+            bar.update(1)
+            report = job.report or {}
+            results.append({
+                "username": account["username"],
+                "state": job.state,
+                "output": job.output_path if job.state == DONE else None,
+                "error": job.error,
+                "seconds": round(job.finished_at - job.started_at, 3) if job.started_at else None,
+                "messages": report.get("messages"),
+                "pages": report.get("pages"),
+                "requests": sum(endpoint["requests"] for endpoint in report.get("network", {}).values()),
+            })
+
+    return {
+        "accounts": len(results),
+        "done": sum(1 for result in results if result["state"] == DONE),
+        "failed": sum(1 for result in results if result["state"] != DONE),
+        "seconds": round(time.perf_counter() - started, 3),
+        "unique_posts": len(posts),
+        "image_cache": {"hits": manager.image_cache.hits, "disk_hits": manager.image_cache.disk_hits,
+                        "misses": manager.image_cache.misses},
+        "metrics": manager.metrics.report(),
+        "results": results,
+    }
+
+def _output_name(username, taken):
+    base = re.sub(r"[^A-Za-z0-9_.-]+", "_", username.split("@")[0]) or "yearbook"
+    name, suffix = f"{base}.pdf", 2
+    while name in taken:
+        name, suffix = f"{base}-{suffix}.pdf", suffix + 1
+    return name
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="generate the yearbooks of many accounts in one run")
+    parser.add_argument("accounts", help="CSV file with username and password columns, see read_accounts for the optional ones")
+    parser.add_argument("-o", "--output-dir", default="yearbooks", help="directory the PDFs and the summary are written to")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="number of yearbooks generated concurrently")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="number of concurrent requests per yearbook")
+    parser.add_argument("-f", "--friends", action="store_true", help="include friends' messages unless the CSV says otherwise")
+    parser.add_argument("-d", "--dark", action="store_true", help="use the dark mode color scheme unless the CSV says otherwise")
+    parser.add_argument("--depth", type=int, default=1, help="with --friends, hops of the friend graph to include")
+    parser.add_argument("--max-friends", type=int, help="with --friends, largest number of friends per yearbook")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory used to cache downloaded images between runs")
+    parser.add_argument("--image-dpi", type=float, default=DEFAULT_DPI, help="resolution pictures are downscaled to, 0 keeps the originals")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_QUALITY, help="JPEG quality (1-95) of downscaled pictures")
+    parser.add_argument("--summary", metavar="FILE", help="path of the JSON summary (defaults to summary.json in the output directory)")
+
+    args = parser.parse_args()
+    try:
+        accounts = read_accounts(args.accounts, args.friends, args.dark, args.depth, args.max_friends)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    summary = run_batch(accounts, args.output_dir, jobs=args.jobs, workers=args.workers, image_cache=ImageCache(args.cache_dir),
+                        image_dpi=args.image_dpi or None, image_quality=args.image_quality)
+
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"{summary['done']} of {summary['accounts']} yearbooks generated in {summary['seconds']:.1f}s, summary written to {summary_path}")
+    for result in summary["results"]:
+        if result["state"] != DONE:
+            print(f"Failed: {result['username']}: {result['error']}")
+    if summary["failed"]:
+        sys.exit(1)
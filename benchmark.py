@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from cache import ImageCache
+from fakeportal import FakePortal, SyntheticAccounts
+from generateYearBook import YearBook
+from layout import wrap_text
+from metrics import peak_rss_bytes
+from transport import Transport
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+# result fields compared against a baseline, all of them are better when lower
+TRACKED = ("fetch_s", "friends_s", "images_s", "layout_s", "pdf_s", "total_s", "peak_rss_mb", "output_bytes")
+
+def run_once(config, base_url, work_dir):
+    """Generate one yearbook against the fake portal and measure every phase.
+
+    Runs in a fresh process, so the peak RSS belongs to this run alone.
+
+    Phases:
+        fetch: authentication and your own messages and gallery
+        friends: crawling the friend graph (0 without ``--friends``)
+        images: downloading and caching every image
+        layout: wrapping and planning every message, with a cold layout cache
+        pdf: ``generate_pdf`` with images and layout already warm, i.e. drawing, downscaling and writing
+
+    Returns:
+        dict: Timings in seconds, peak RSS in MB, output size and counts
+    """
+    # keep stdout clean for the JSON results
+    with redirect_stdout(sys.stderr):
+        output_file = os.path.join(work_dir, "yearbook.pdf")
+        transport = Transport(base_url=base_url, pool_size=config["workers"], rate=0)
+        result = {}
+
+        started = time.perf_counter()
+        yb = YearBook("benchmark@iitb.ac.in", "benchmark", dark_mode=config["dark"], workers=config["workers"],
+                      image_cache=ImageCache(os.path.join(work_dir, "cache")), transport=transport,
+                      friend_depth=config["depth"], image_dpi=config["image_dpi"] or None)
+        result["fetch_s"] = time.perf_counter() - started
+
+        phase = time.perf_counter()
+        if config["friends"]:
+            yb.include_friends = True
+            yb.friendMessages = yb.get_friend_messages()
+        result["friends_s"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        yb.download_images()
+        result["images_s"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        wrap_text.cache_clear()
+        message_lists = [yb.messagesForYou, yb.messagesByYou]
+        for friend_data in yb.friendMessages:
+            message_lists += [friend_data['messages_by'], friend_data['messages_for']]
+        for messages in message_lists:
+            yb.layout_messages(messages, 720)
+        result["layout_s"] = time.perf_counter() - phase
+
+        phase = time.perf_counter()
+        yb.generate_pdf(output_file, processes=config["processes"], stream=config["stream"])
+        result["pdf_s"] = time.perf_counter() - phase
+        result["total_s"] = time.perf_counter() - started
+
+    from pypdf import PdfReader
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["output_bytes"] = os.path.getsize(output_file)
+    result["pages"] = len(PdfReader(output_file).pages)
+    result["messages"] = yb.total_messages()
+    result["unique_posts"] = len(yb.posts)
+    result["friends"] = len(yb.friendMessages)
+    result["downloaded_bytes"] = transport.summary()["bytes"]
+    return result
+
+def run(config, repeat=3):
+    """Serve synthetic accounts and run the benchmark ``repeat`` times.
+
+    Args:
+        config (dict): Scale and generation options, see the command line flags
+        repeat (int): Number of runs, each in its own process with a cold image cache
+
+    Returns:
+        dict: The configuration, environment, every run and the median of each field
+    """
+    accounts = SyntheticAccounts(users=config["users"], friends=config["friend_count"], messages=config["messages"],
+                                 words=config["words"], image_size=config["image_size"], gallery=config["gallery"],
+                                 seed=config["seed"])
+    runs = []
+    with FakePortal(accounts, latency=config["latency"]) as portal:
+        for _ in range(repeat):
+            requests_before = portal.requests
+            with tempfile.TemporaryDirectory(prefix="yearbook-bench-") as work_dir:
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(run_once, config, portal.url, work_dir).result()
+            result["requests"] = portal.requests - requests_before
+            runs.append(result)
+
+    return {
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "runs": runs,
+        "median": {key: statistics.median(r[key] for r in runs) for key in runs[0]},
+    }
+
+def compare(results, baseline, tolerance):
+    """Fields of ``TRACKED`` whose median grew by more than ``tolerance`` over the baseline.
+
+    Returns:
+        list: ``(field, baseline value, current value)`` tuples
+    """
+    regressions = []
+    for key in TRACKED:
+        old, new = baseline["median"].get(key), results["median"].get(key)
+        if old is None or new is None:
+            continue
+        # ignore noise on phases that take next to no time
+        if new > old * (1 + tolerance) and new - old > (0.05 if key.endswith("_s") else 0):
+            regressions.append((key, old, new))
+    return regressions
+
+def _peak_rss_mb():
+    peak = peak_rss_bytes(children=True)
+    return None if peak is None else round(peak / (1024 * 1024), 1)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="benchmark yearbook generation against a local fake portal")
+    parser.add_argument("--users", type=int, default=200, help="number of people on the fake portal")
+    parser.add_argument("--friend-count", type=int, default=20, help="number of people the benchmarked account exchanged messages with")
+    parser.add_argument("--messages", type=int, default=5, help="number of messages written by every other user")
+    parser.add_argument("--words", type=int, default=120, help="average number of words per message")
+    parser.add_argument("--image-size", type=int, default=600, help="width and height of profile pictures in pixels")
+    parser.add_argument("--gallery", type=int, default=4, help="number of group photos")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every response of the fake portal is delayed by")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic accounts")
+    parser.add_argument("-f", "--friends", action="store_true", help="include friends' messages")
+    parser.add_argument("--depth", type=int, default=1, help="with --friends, hops of the friend graph to crawl")
+    parser.add_argument("-d", "--dark", action="store_true", help="use dark mode color scheme")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="number of concurrent requests")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of processes rendering the PDF")
+    parser.add_argument("-s", "--stream", action="store_true", help="stream finished sections to disk")
+    parser.add_argument("--image-dpi", type=float, default=150, help="resolution pictures are downscaled to, 0 keeps the originals")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of runs, the median is reported")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", help="JSON results of an earlier run; exit with status 1 if a phase regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="with --baseline, allowed relative growth of every tracked field")
+
+    args = parser.parse_args()
+    config = {key: value for key, value in vars(args).items() if key not in ("repeat", "output", "baseline", "tolerance")}
+    results = run(config, repeat=max(1, args.repeat))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, old, new in regressions:
+            print(f"Regression: {key} went from {old} to {new}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,288 @@
+from collections import Counter, OrderedDict
+from imaging import DEFAULT_QUALITY, SharedImageReader, downscale
+import hashlib
+import os
+import threading
+
+DEFAULT_CACHE_DIR = ".yearbook-cache"
+
+class ImageCache:
+    """Content-addressed cache for images downloaded from the yearbook portal.
+
+    Images are looked up by URL. The bytes are stored once per content digest,
+    so two URLs serving the same picture share a blob and a decoded reader.
+
+    Downscaled variants (see ``imaging.downscale``) are cached the same way,
+    keyed by URL, pixel size and quality, so every face is resampled once.
+
+    Two tiers are kept:
+        * memory: an LRU of decoded ``SharedImageReader`` objects, bounded by
+          ``max_memory_bytes`` of encoded plus decoded pixel data. Drawing the
+          same reader repeatedly lets reportlab embed the image once as a shared
+          XObject and skip re-decoding it.
+        * disk: ``<cache_dir>/blobs/<sha256>`` holding the raw bytes plus
+          ``<cache_dir>/urls/<sha1(url)>`` pointing at the blob. The blob
+          directory is bounded by ``max_disk_bytes`` and evicted oldest first,
+          sparing only the blobs of lookups in flight.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_memory_bytes=128 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory for the on-disk tier, None to disable it
+            max_memory_bytes (int): Upper bound on the size of the decoded images kept in memory
+            max_disk_bytes (int): Upper bound on the size of the blob directory
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._digests = {}              # url -> content digest
+        self._readers = OrderedDict()   # content digest -> ImageReader
+        self._memory_bytes = 0          # size of the readers, see SharedImageReader.nbytes
+        self._pins = Counter()          # content digest -> lookups that resolved it but did not load it yet
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self._blobs = {}                # content digest -> bytes, only without a disk tier
+        self._disk_bytes = 0
+
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+            os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in _blob_entries(self._blob_dir()))
+
+    def get(self, url, fetch, size=None, quality=DEFAULT_QUALITY):
+        """Return a shared ``ImageReader`` for ``url``.
+
+        Args:
+            url (str): Absolute image URL, used as the cache key
+            fetch (callable): Called with ``url`` on a miss, returns the image bytes
+            size (tuple): Largest width and height in pixels, None for the original image
+            quality (int): JPEG quality used when the image has to be downscaled to ``size``
+
+        Returns:
+            ImageReader or None if the image is empty
+        """
+        digest = self._resolve_variant(url, fetch, size, quality)
+        if digest is None:
+            return None
+        try:
+            with self._lock:
+                reader = self._readers.get(digest)
+                if reader is not None:
+                    self._readers.move_to_end(digest)
+                    return reader
+            reader = SharedImageReader(self._load_blob(digest))
+            with self._lock:
+                if digest in self._readers:
+                    reader = self._readers[digest]
+                else:
+                    self._readers[digest] = reader
+                    self._memory_bytes += reader.nbytes
+                self._readers.move_to_end(digest)
+                # the newest reader stays even if it alone exceeds the bound
+                while self._memory_bytes > self.max_memory_bytes and len(self._readers) > 1:
+                    _, dropped = self._readers.popitem(last=False)
+                    self._memory_bytes -= dropped.nbytes
+            return reader
+        finally:
+            self._unpin(digest)
+
+    def get_bytes(self, url, fetch, size=None, quality=DEFAULT_QUALITY):
+        """Return the bytes for ``url``, fetching them at most once, see ``get`` for ``size`` and ``quality``."""
+        digest = self._resolve_variant(url, fetch, size, quality)
+        if digest is None:
+            return b""
+        try:
+            return self._load_blob(digest)
+        finally:
+            self._unpin(digest)
+
+    def release(self, lookups=None):
+        """Drop decoded images held in memory, they are reloaded on the next ``get``.
+
+        Without a disk tier the raw bytes are dropped as well and fetched again when needed,
+        except those a concurrent lookup resolved and is about to load.
+
+        Args:
+            lookups (iterable): ``(url, size, quality)`` of the images to drop, as passed to ``get``,
+                so that a cache shared by several yearbooks keeps the others' images; all if None
+        """
+        with self._lock:
+            if lookups is None:
+                digests = set(self._readers) | set(self._blobs)
+            else:
+                keys = set()
+                for url, size, quality in lookups:
+                    keys.add(url)
+                    if size is not None:
+                        keys.add(_variant_key(url, size, quality))
+                digests = {self._digests[key] for key in keys if key in self._digests}
+            for digest in digests:
+                reader = self._readers.pop(digest, None)
+                if reader is not None:
+                    self._memory_bytes -= reader.nbytes
+            if not self.cache_dir:
+                dropped = digests - set(self._pins)
+                self._blobs = {digest: data for digest, data in self._blobs.items() if digest not in dropped}
+                self._digests = {url: digest for url, digest in self._digests.items() if digest not in dropped}
+
+    def _resolve_variant(self, url, fetch, size, quality):
+        """Map ``url`` at ``size`` and ``quality`` to a content digest, downscaling the original on a miss."""
+        if size is None:
+            return self._resolve(url, fetch)
+
+        def process(_):
+            data = self.get_bytes(url, fetch)
+            return downscale(data, size, quality) if data else b""
+
+        # variants share the url -> digest maps, an image that already fits resolves to the original blob
+        return self._resolve(_variant_key(url, size, quality), process)
+
+    def _resolve(self, url, fetch):
+        """Map ``url`` to a content digest, downloading on a miss.
+
+        The digest is returned pinned, so ``release`` keeps its bytes until the caller
+        loaded them and calls ``_unpin``.
+        """
+        with self._lock:
+            digest = self._digests.get(url)
+            if digest is not None:
+                self.hits += 1
+                self._pins[digest] += 1
+                return digest
+            # one download per url even when several threads ask at once
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            with self._lock:
+                digest = self._digests.get(url)
+                if digest is not None:
+                    self.hits += 1
+                    self._pins[digest] += 1
+                    return digest
+
+            digest = self._read_pointer(url)
+            if digest is not None and self._pin_blob(digest):
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                data = fetch(url)
+                if not data:
+                    return None
+                digest = hashlib.sha256(data).hexdigest()
+                with self._lock:
+                    # pinned before it is stored, so a concurrent release or eviction cannot drop it in between
+                    self._pins[digest] += 1
+                    if not self.cache_dir:
+                        self._blobs[digest] = data
+                if self.cache_dir:
+                    try:
+                        self._store(url, digest, data)
+                    except BaseException:
+                        self._unpin(digest)
+                        raise
+
+            with self._lock:
+                self._digests[url] = digest
+                self._url_locks.pop(url, None)
+            return digest
+
+    def _pin_blob(self, digest):
+        """Pin a blob found on disk, False if it was evicted since."""
+        with self._lock:
+            if not os.path.exists(os.path.join(self._blob_dir(), digest)):
+                return False
+            self._pins[digest] += 1
+            return True
+
+    def _unpin(self, digest):
+        with self._lock:
+            self._pins[digest] -= 1
+            if not self._pins[digest]:
+                del self._pins[digest]
+
+    def _blob_dir(self):
+        return os.path.join(self.cache_dir, "blobs")
+
+    def _pointer_path(self, url):
+        return os.path.join(self.cache_dir, "urls", hashlib.sha1(url.encode()).hexdigest())
+
+    def _read_pointer(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._pointer_path(url)) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        try:
+            # most recently used blobs are evicted last
+            os.utime(os.path.join(self._blob_dir(), digest))
+        except OSError:
+            # the blob was evicted, treat it as a miss
+            return None
+        return digest
+
+    def _store(self, url, digest, data):
+        blob = os.path.join(self._blob_dir(), digest)
+        if not os.path.exists(blob):
+            _write_atomic(blob, data)
+            with self._lock:
+                self._disk_bytes += len(data)
+            self._evict()
+        _write_atomic(self._pointer_path(url), digest.encode())
+
+    def _load_blob(self, digest):
+        if not self.cache_dir:
+            with self._lock:
+                return self._blobs[digest]
+        with open(os.path.join(self._blob_dir(), digest), "rb") as f:
+            return f.read()
+
+    def _evict(self):
+        """Drop the least recently used blobs that no lookup pinned until the disk tier fits its bound."""
+        with self._lock:
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # only blobs a lookup is about to load must stay, decoded readers no longer need theirs
+            pinned = set(self._pins)
+            evicted = set()
+            for _, size, entry in sorted(_blob_entries(self._blob_dir()), key=lambda e: e[0]):
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                if entry.name in pinned:
+                    continue
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+                evicted.add(entry.name)
+            if evicted:
+                # urls of evicted blobs are looked up again, which treats them as a miss
+                self._digests = {url: digest for url, digest in self._digests.items() if digest not in evicted}
+
+def _variant_key(url, size, quality):
+    return f"{url}#{size[0]}x{size[1]}q{quality}"
+
+def _blob_entries(blob_dir):
+    """``(mtime, size, entry)`` of every complete blob, skipping files being written or already gone."""
+    for entry in os.scandir(blob_dir):
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        yield stat.st_mtime, stat.st_size, entry
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
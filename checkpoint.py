@@ -0,0 +1,95 @@
+from posts import Message
+import hashlib
+import json
+import os
+import re
+import shutil
+
+class Checkpoint:
+    """Work directory that lets an interrupted run pick up where it stopped.
+
+    Layout:
+        meta.json: the account and the options the crawl depends on
+        friends/<friend ID>.json: the message lists of every friend crawled so far
+        sections/<render options>/<section>.pdf: every section rendered so far
+
+    Every file is written under a temporary name and renamed when complete,
+    so a crash never leaves a half-written entry behind. Rendered sections
+    are kept per combination of render options, so resuming with e.g.
+    ``--dark`` reuses the crawl but renders every section again.
+    """
+
+    def __init__(self, work_dir, account, options, resume=False):
+        """Open or start a checkpoint.
+
+        Args:
+            work_dir (str): Directory holding the checkpoint, created if needed
+            account (str): Whose yearbook is generated, e.g. the username
+            options (dict): JSON-serializable options the crawled data depends on
+            resume (bool): Continue the run checkpointed in ``work_dir``, otherwise it is discarded
+
+        Raises:
+            ValueError: If ``resume`` is set and ``work_dir`` holds a run for another account or other options
+        """
+        self.work_dir = work_dir
+        self.friends_dir = os.path.join(work_dir, "friends")
+        self.sections_dir = os.path.join(work_dir, "sections")
+        meta_path = os.path.join(work_dir, "meta.json")
+        meta = {"account": account, "options": options}
+
+        previous = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                previous = json.load(f)
+        if resume and previous is not None and previous != meta:
+            raise ValueError(f"{work_dir} holds a run for {previous['account']} with options {previous['options']}, "
+                             f"not {account} with {options}; use another work directory or start over without --resume")
+        self.resumed = resume and previous is not None
+        if not self.resumed:
+            shutil.rmtree(self.friends_dir, ignore_errors=True)
+            shutil.rmtree(self.sections_dir, ignore_errors=True)
+
+        os.makedirs(self.friends_dir, exist_ok=True)
+        os.makedirs(self.sections_dir, exist_ok=True)
+        _write_json(meta_path, meta)
+
+    def friend(self, friend_id):
+        """The checkpointed ``(messages_by, messages_for)`` of a friend as ``Message`` records, None if not crawled yet."""
+        path = self._friend_path(friend_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        return ([Message.from_post(post) for post in data["messages_by"]],
+                [Message.from_post(post) for post in data["messages_for"]])
+
+    def save_friend(self, friend_id, messages_by, messages_for):
+        """Checkpoint the message lists of a friend that was crawled successfully."""
+        _write_json(self._friend_path(friend_id), {
+            "messages_by": [message.to_post() for message in messages_by],
+            "messages_for": [message.to_post() for message in messages_for],
+        })
+
+    def fragment(self, section, render_options):
+        """Path of the PDF fragment of a section; it exists once the section has been rendered completely.
+
+        Args:
+            section (str): Stable name of the section, e.g. ``front`` or ``friend-42``
+            render_options (dict): JSON-serializable options the rendering depends on
+        """
+        digest = hashlib.sha1(json.dumps(render_options, sort_keys=True).encode()).hexdigest()[:12]
+        directory = os.path.join(self.sections_dir, digest)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{_file_name(section)}.pdf")
+
+    def _friend_path(self, friend_id):
+        return os.path.join(self.friends_dir, f"{_file_name(friend_id)}.json")
+
+def _file_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name))
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
@@ -0,0 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+class FriendCrawler:
+    """Fetch the message lists of many friends concurrently.
+
+    Every friend needs two independent requests (``posts/my`` and
+    ``posts/others``), so they are all queued on one thread pool. Throttling
+    and retries are left to the transport the requests go through. Results
+    are returned in the order of the given friend IDs, so the rendered PDF
+    does not depend on which request finished first.
+    """
+
+    def __init__(self, fetch_json, workers=8):
+        """Initialize the crawler.
+
+        Args:
+            fetch_json (callable): Called with a portal-relative path, returns the posts listed there
+            workers (int): Number of requests in flight at once
+        """
+        self.fetch_json = fetch_json
+        self.workers = max(1, workers)
+
+    def crawl(self, friend_ids, progress=None, known=None):
+        """Fetch the messages written by and for every friend.
+
+        Returns:
+            list: ``(friend_id, messages_by, messages_for, error)`` tuples, see ``iter_crawl``
+        """
+        return list(self.iter_crawl(friend_ids, progress, known))
+
+    def iter_crawl(self, friend_ids, progress=None, known=None):
+        """Fetch the messages written by and for every friend, yielding each one as soon as it is done.
+
+        A friend is yielded once its lists and those of every friend before it
+        arrived, so results come in the order of ``friend_ids`` while the rest
+        are still downloading.
+
+        Args:
+            friend_ids (list): Friend user IDs, in the order results should be returned
+            progress (callable): Called with ``(done, total)`` whenever all requests of a friend finished
+            known (callable): Called with a friend ID, returns ``(messages_by, messages_for)`` if they are
+                already at hand and need not be fetched, else None
+
+        Yields:
+            tuple: ``(friend_id, messages_by, messages_for, error)`` in the order of ``friend_ids``.
+            ``error`` is the exception that made the friend fail, or None.
+        """
+        lock = threading.Lock()
+        cached = {}
+        if known is not None:
+            for friend_id in friend_ids:
+                lists = known(friend_id)
+                if lists is not None:
+                    cached[friend_id] = lists
+        pending = {friend_id: 2 for friend_id in friend_ids if friend_id not in cached}
+        finished = [len(cached)]
+        if cached and progress is not None:
+            progress(len(cached), len(friend_ids))
+
+        def request_done(friend_id):
+            with lock:
+                pending[friend_id] -= 1
+                if pending[friend_id]:
+                    return
+                finished[0] += 1
+                done = finished[0]
+            if progress is not None:
+                progress(done, len(friend_ids))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                friend_id: (pool.submit(self.fetch_json, f"/api/posts/my/{friend_id}"),
+                            pool.submit(self.fetch_json, f"/api/posts/others/{friend_id}"))
+                for friend_id in friend_ids if friend_id not in cached
+            }
+            for friend_id, (by_future, for_future) in futures.items():
+                by_future.add_done_callback(lambda _, friend_id=friend_id: request_done(friend_id))
+                for_future.add_done_callback(lambda _, friend_id=friend_id: request_done(friend_id))
+            for friend_id in friend_ids:
+                if friend_id in cached:
+                    result = (friend_id, *cached[friend_id], None)
+                else:
+                    by_future, for_future = futures[friend_id]
+                    try:
+                        result = (friend_id, by_future.result(), for_future.result(), None)
+                    except Exception as e:
+                        result = (friend_id, None, None, e)
+                yield result
+
+    def crawl_graph(self, friend_ids, visit, depth=1, budget=None, progress=None, known=None, retries=2, retry_delay=5.0):
+        """Crawl the friend graph breadth first, one hop at a time.
+
+        Every hop is fetched with ``iter_crawl`` and ``visit`` is called for
+        each friend in order as soon as it is fetched, so the caller can use
+        the first friends while the rest of the hop is downloading. Friends
+        that failed are fetched again at the end of their hop and visited
+        after the rest of it, so a portal hiccup does not drop them. ``visit``
+        returns that friend's own correspondents, which make up the next hop.
+        Nobody is fetched twice unless it failed.
+
+        Args:
+            friend_ids (list): Friends one hop away, in the order they should be visited
+            visit (callable): Called with ``(friend_id, messages_by, messages_for, error)``, returns the
+                IDs of the friend's correspondents (ignored on the last hop)
+            depth (int): Number of hops to crawl, 1 only fetches ``friend_ids``
+            budget (int): Largest number of friends fetched in total, None for no limit
+            progress (callable): Called with ``(done, total)``, ``total`` grows as hops are discovered
+            known (callable): Lists already at hand, passed on to ``crawl``
+            retries (int): Number of times the friends that failed in a hop are fetched again
+            retry_delay (float): Seconds to wait before every retry round, doubled for each further round
+
+        Returns:
+            int: Number of friends visited, whether fetched or ``known``
+        """
+        seen = set(friend_ids)
+        hop = list(friend_ids)[:budget]
+        fetched = 0
+        for level in range(depth):
+            if not hop:
+                break
+            offset = fetched
+            hop_progress = None if progress is None else (lambda done, total, offset=offset: progress(offset + done, offset + total))
+            next_hop = []
+            failures = []
+            for result in self.iter_crawl(hop, hop_progress, known):
+                if result[3] is not None:
+                    failures.append(result)
+                    continue
+                self._visit(visit, result, level + 1 < depth, seen, next_hop)
+            for result in self._retry(failures, known, retries, retry_delay):
+                self._visit(visit, result, level + 1 < depth, seen, next_hop)
+            fetched += len(hop)
+            hop = next_hop if budget is None else next_hop[:max(budget - fetched, 0)]
+        return fetched
+
+    def _visit(self, visit, result, expand, seen, next_hop):
+        friend_id, messages_by, messages_for, error = result
+        neighbours = visit(friend_id, messages_by, messages_for, error)
+        if expand and error is None:
+            for neighbour in neighbours:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    next_hop.append(neighbour)
+
+    def _retry(self, failures, known, retries, retry_delay):
+        """Fetch failed friends again for up to ``retries`` rounds, returns the last result of each in order."""
+        results = {result[0]: result for result in failures}
+        for attempt in range(retries):
+            failed = [friend_id for friend_id, result in results.items() if result[3] is not None]
+            if not failed:
+                break
+            time.sleep(retry_delay * 2 ** attempt)
+            results.update((result[0], result) for result in self.crawl(failed, known=known))
+        return list(results.values())
@@ -0,0 +1,88 @@
+import threading
+import time
+
+# rough share of the total run time spent in every phase, friends dominate when they are included
+PHASE_WEIGHTS = {"fetch": 1, "friends": 6, "images": 1, "render": 2}
+
+class ProgressTracker:
+    """Collects the progress events emitted by ``YearBook`` and derives ETAs from them.
+
+    An instance can be passed directly as ``YearBook``'s ``event_callback``.
+    Every event updates the state of its phase (done, total, extra fields
+    such as bytes transferred) and bumps ``version``, so readers can block in
+    ``wait`` until something new happened instead of polling.
+    """
+
+    def __init__(self, phases=("fetch", "images", "render"), weights=PHASE_WEIGHTS):
+        """Initialize the tracker.
+
+        Args:
+            phases (tuple): Phases the run is expected to go through, add ``friends`` when they are crawled
+            weights (dict): Relative duration of every phase, used for the overall percentage
+        """
+        self.planned = phases
+        self.weights = weights
+        self.phases = {}
+        self.phase = None
+        self.version = 0
+        self.finished = False
+        self.started_at = time.time()
+        self._changed = threading.Condition()
+
+    def __call__(self, phase, done, total, **extra):
+        now = time.time()
+        with self._changed:
+            state = self.phases.get(phase)
+            if state is None:
+                state = self.phases[phase] = {"started_at": now}
+            state.update(extra, done=done, total=total)
+            elapsed = now - state["started_at"]
+            remaining = max(total - done, 0)
+            state["eta"] = round(elapsed / done * remaining, 1) if done else None
+            self.phase = phase
+            self.version += 1
+            self._changed.notify_all()
+
+    def finish(self):
+        """Mark the run as over and wake up every waiting reader."""
+        with self._changed:
+            self.finished = True
+            self.version += 1
+            self._changed.notify_all()
+
+    def percent(self):
+        """Overall progress in percent, weighting each phase by its expected share of the run time."""
+        with self._changed:
+            return self._percent()
+
+    def snapshot(self):
+        """The current state as a JSON-serializable dict."""
+        with self._changed:
+            percent = self._percent()
+            elapsed = time.time() - self.started_at
+            return {
+                "phase": self.phase,
+                "percent": percent,
+                "eta": round(elapsed / percent * (100 - percent), 1) if percent else None,
+                "phases": {name: {k: v for k, v in state.items() if k != "started_at"}
+                           for name, state in self.phases.items()},
+                "version": self.version,
+                "finished": self.finished,
+            }
+
+    def wait(self, version, timeout=None):
+        """Block until ``version`` is outdated or ``timeout`` expires, then return ``snapshot()``."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+        return self.snapshot()
+
+    def _percent(self):
+        if self.finished:
+            return 100
+        # phases that have not started yet still count, with nothing done
+        weights = {phase: self.weights.get(phase, 1) for phase in (*self.planned, *self.phases)}
+        progress = 0
+        for phase, state in self.phases.items():
+            fraction = min(state["done"] / state["total"], 1) if state["total"] else 1
+            progress += weights[phase] * fraction
+        return min(int(progress / sum(weights.values()) * 100), 99)
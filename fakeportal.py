@@ -0,0 +1,247 @@
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from PIL import Image
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+DEPARTMENTS = ["Computer Science and Engineering", "Electrical Engineering", "Mechanical Engineering",
+               "Energy Science & Engineering", "Chemical Engineering", "Physics"]
+WORDS = ["hello", "friend", "memories", "late", "nights", "hostel", "canteen", "deadlines", "dreams",
+         "quiz", "lab", "insti", "fest", "wing", "mess", "library", "\U0001F600", "❤️"]
+
+class SyntheticAccounts:
+    """Synthetic yearbook data for a whole batch of users.
+
+    User 0 is the account being benchmarked. It exchanged one message each way
+    with ``friends`` people, who in turn write to random other users, so the
+    friend graph reaches further than one hop. Everybody else writes
+    ``messages`` posts to random users.
+    """
+
+    def __init__(self, users=200, friends=20, messages=5, words=120, image_size=600, gallery=4, seed=1):
+        """Generate the accounts.
+
+        Args:
+            users (int): Number of people on the portal
+            friends (int): Number of people user 0 exchanged messages with
+            messages (int): Number of posts written by everybody else
+            words (int): Average number of words per post
+            image_size (int): Width and height of profile pictures in pixels
+            gallery (int): Number of group photos in user 0's gallery
+            seed (int): Seed for the random generator, the same seed gives the same posts
+        """
+        self.users = max(users, friends + 1)
+        self.image_size = image_size
+        self.gallery = gallery
+        rng = random.Random(seed)
+        self.posts = []
+        self.by_author = {user: [] for user in range(self.users)}
+        self.by_recipient = {user: [] for user in range(self.users)}
+        # like on the real portal, everybody has one department and graduation year
+        self.departments = [rng.choice(DEPARTMENTS) for _ in range(self.users)]
+        self.years = [str(rng.randint(2021, 2025)) for _ in range(self.users)]
+
+        def write(author, recipient):
+            post = {
+                "id": len(self.posts) + 1,
+                "written_by": f"User {author}",
+                "written_for": f"User {recipient}",
+                "written_by_profile": self._profile(author),
+                "written_for_profile": self._profile(recipient),
+                "written_by_dept": self.departments[author],
+                "written_by_year": self.years[author],
+                "written_for_dept": self.departments[recipient],
+                "written_for_year": self.years[recipient],
+                "content": self._content(rng, words),
+            }
+            self.posts.append(post)
+            self.by_author[author].append(post)
+            self.by_recipient[recipient].append(post)
+
+        for friend in range(1, friends + 1):
+            write(0, friend)
+            write(friend, 0)
+        for author in range(1, self.users):
+            count = messages - 1 if author <= friends else messages
+            for recipient in rng.sample(range(1, self.users), min(count, self.users - 1)):
+                if recipient != author:
+                    write(author, recipient)
+
+    def _profile(self, user):
+        return {"user": user, "name": f"User {user}", "profile_image": f"/media/profile/{user}.jpg"}
+
+    def _content(self, rng, words):
+        count = max(1, int(rng.triangular(1, words * 2, words)))
+        paragraphs = [" ".join(rng.choice(WORDS) for _ in range(count // 3 + 1)) for _ in range(3)]
+        return "\n".join(paragraphs)
+
+    def gallery_for(self, user):
+        """The gallery payload of ``user``."""
+        photos = {"cover": f"/media/cover/{user}.jpg"}
+        for i in range(1, self.gallery + 1):
+            photos[f"img{i}"] = f"/media/gallery/{user}/{i}.jpg"
+        return photos
+
+    @lru_cache(maxsize=4096)
+    def image(self, path):
+        """JPEG bytes for an image path, None if there is no such image."""
+        match = re.fullmatch(r"/media/(profile|cover|gallery)/(\d+)(?:/(\d+))?\.jpg", path)
+        if match is None:
+            return None
+        kind = match.group(1)
+        size = {"profile": (self.image_size, self.image_size),
+                "cover": (self.image_size * 2, self.image_size * 3 // 5),
+                "gallery": (self.image_size * 3 // 2, self.image_size)}[kind]
+        seed = zlib.crc32(path.encode()) & 0xFFFFFF
+        # noise keeps JPEG sizes close to real photos, a flat color would compress to nothing
+        tint = Image.new("RGB", size, (seed & 0xFF, (seed >> 8) & 0xFF, (seed >> 16) & 0xFF))
+        noise = Image.effect_noise(size, 60).convert("RGB")
+        out = BytesIO()
+        Image.blend(tint, noise, 0.5).save(out, "JPEG", quality=90)
+        return out.getvalue()
+
+class FakePortal:
+    """Local HTTP server standing in for the yearbook portal.
+
+    Serves the authentication (with token refresh), current user,
+    ``posts/my``, ``posts/others``, gallery and image endpoints from
+    ``SyntheticAccounts``, with ETags on the message lists. Every response is
+    delayed by ``latency`` seconds, and access tokens expire after
+    ``token_lifetime`` seconds. Use it as a context manager and point a
+    ``Transport`` at ``url``.
+    """
+
+    def __init__(self, accounts=None, latency=0.0, password=None, host="127.0.0.1", port=0, token_lifetime=None):
+        """Initialize the portal, ``start`` begins serving.
+
+        Args:
+            accounts (SyntheticAccounts): Data to serve, a default batch is generated if None
+            latency (float): Seconds every response is delayed by
+            password (str): Only this password is accepted, any is if None
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 picks a free one
+            token_lifetime (float): Seconds an access token is accepted, forever if None
+        """
+        self.accounts = accounts if accounts is not None else SyntheticAccounts()
+        self.latency = latency
+        self.password = password
+        self.requests = 0
+        self.token_lifetime = token_lifetime
+        self._tokens = {}  # access token -> time it was issued
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, method, path, headers, body):
+        """Answer one request.
+
+        Returns:
+            tuple: ``(status, content type, body bytes, extra headers)``
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == "POST" and path == "/api/authenticate/token/":
+            credentials = json.loads(body or b"{}")
+            if not credentials.get("username") or (self.password is not None and credentials.get("password") != self.password):
+                return _json(401, {"detail": "No active account found with the given credentials"})
+            return _json(200, {"access": self._issue_token(), "refresh": "fake-refresh-token"})
+        if method == "POST" and path == "/api/authenticate/token/refresh/":
+            if json.loads(body or b"{}").get("refresh") != "fake-refresh-token":
+                return _json(401, {"detail": "Token is invalid or expired"})
+            return _json(200, {"access": self._issue_token()})
+
+        if method != "GET":
+            return _json(405, {"detail": "Method not allowed"})
+
+        if path.startswith("/media/"):
+            image = self.accounts.image(path)
+            return (200, "image/jpeg", image, {}) if image is not None else _json(404, {"detail": "Not found"})
+
+        if not self._valid_token(headers.get("Authorization", "").replace("Bearer ", "", 1)):
+            return _json(401, {"detail": "Given token not valid for any token type"})
+
+        if path == "/api/authenticate/current_user/":
+            return _json(200, {"id": 0})
+        match = re.fullmatch(r"/api/posts/(my|others)/(\d+)/?", path)
+        if match:
+            index = self.accounts.by_author if match.group(1) == "my" else self.accounts.by_recipient
+            status, content_type, payload, extra = _json(200, index.get(int(match.group(2)), []))
+            etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+            if headers.get("If-None-Match") == etag:
+                return 304, content_type, b"", {"ETag": etag}
+            return status, content_type, payload, {"ETag": etag}
+        match = re.fullmatch(r"/api/authenticate/profile/(\d+)/gallery/?", path)
+        if match:
+            return _json(200, self.accounts.gallery_for(int(match.group(1))))
+        return _json(404, {"detail": "Not found"})
+
+    def _issue_token(self):
+        with self._lock:
+            token = f"fake-access-token-{len(self._tokens) + 1}"
+            self._tokens[token] = time.monotonic()
+        return token
+
+    def _valid_token(self, token):
+        with self._lock:
+            issued = self._tokens.get(token)
+        return issued is not None and (self.token_lifetime is None or time.monotonic() - issued < self.token_lifetime)
+
+def _json(status, data):
+    return status, "application/json", json.dumps(data).encode(), {}
+
+def _handler(portal):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real portal
+
+        def do_GET(self):
+            self._answer("GET")
+
+        def do_POST(self):
+            self._answer("POST")
+
+        def _answer(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            status, content_type, payload, extra = portal.respond(method, self.path, self.headers, body)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
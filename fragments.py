@@ -0,0 +1,257 @@
+from pypdf import PdfReader
+from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+                           PdfObject, StreamObject)
+import hashlib
+import re
+
+class FragmentMerger:
+    """Concatenate PDF fragments into one document while streaming it to disk.
+
+    Every fragment is read lazily and its pages, plus every object they
+    reference, are renumbered and written straight to the output file. Only
+    one fragment is open at a time, so memory does not grow with the size of
+    the book. Objects whose content is identical across fragments, such as
+    the same profile picture or the standard fonts in two friend sections,
+    are written once and shared: each one is identified by a digest of its
+    content and of the digests of everything it references.
+
+    Embedded TrueType subsets of one font are merged when one of them
+    extends the other, which is the case for fragments rendered with a
+    shared ``assets.FontSubsets``: every fragment only knows the glyphs
+    assigned up to its own save, so the most complete version is kept in
+    memory and written once on ``close``.
+    """
+
+    def __init__(self, output_file):
+        """Start the merged document.
+
+        Args:
+            output_file (str): Path of the merged PDF
+        """
+        self._file = open(output_file, "wb")
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # object 1 is the catalog and object 2 the page tree, both written on close
+        self._offsets = [None, None]
+        self._pages = []
+        self._objects = {}  # content digest -> object number
+        self._fonts = {}    # subset font name -> [[object number, glyph codes, detached font], ...]
+
+    def append(self, fragment):
+        """Copy all pages of a fragment to the end of the document.
+
+        Args:
+            fragment (str): Path of the fragment PDF
+        """
+        reader = PdfReader(fragment)
+        numbers = {}
+        digests = {}
+        pending = []
+
+        def digest(reference):
+            """Content digest of a referenced object, None if it must not be shared (pages and cycles)."""
+            key = (reference.idnum, reference.generation)
+            if key in digests:
+                return digests[key]
+            digests[key] = None
+            obj = reference.get_object()
+            font = self._subset_font(obj)
+            if font is not None:
+                # the font a fragment references may be replaced by a more complete version, see close
+                numbers[key] = font
+                value = b"font %d" % font
+            elif isinstance(obj, DictionaryObject) and obj.get("/Type") == "/Page":
+                value = None
+            else:
+                value = _digest(obj, digest)
+            digests[key] = value
+            return value
+
+        def renumber(reference):
+            key = (reference.idnum, reference.generation)
+            number = numbers.get(key)
+            if number is None:
+                value = digest(reference)
+                number = numbers.get(key)
+            if number is None:
+                number = self._objects.get(value) if value is not None else None
+                if number is None:
+                    number = self._reserve()
+                    pending.append((number, reference.get_object()))
+                    if value is not None:
+                        self._objects[value] = number
+                numbers[key] = number
+            return IndirectObject(number, 0, None)
+
+        for page in reader.pages:
+            number = self._reserve()
+            if page.indirect_reference is not None:
+                numbers[(page.indirect_reference.idnum, page.indirect_reference.generation)] = number
+            new_page = DictionaryObject()
+            for key, value in page.items():
+                if key != "/Parent":
+                    new_page[NameObject(key)] = _copy(value, renumber)
+            new_page[NameObject("/Parent")] = IndirectObject(2, 0, None)
+            self._write(number, new_page)
+            self._pages.append(number)
+
+            while pending:
+                number, obj = pending.pop()
+                self._write(number, _copy(obj, renumber))
+
+        reader.stream.close()
+
+    def close(self):
+        """Write the fonts, page tree, catalog and cross-reference table and close the file."""
+        for families in self._fonts.values():
+            for number, _, font in families:
+                self._write(number, _copy(font, self._write_detached))
+
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(n, 0, None) for n in self._pages),
+            NameObject("/Count"): NumberObject(len(self._pages)),
+        })
+        self._write(2, pages)
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(2, 0, None),
+        })
+        self._write(1, catalog)
+
+        xref = self._file.tell()
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self._offsets) + 1))
+        for offset in self._offsets:
+            self._file.write(b"%010d 00000 n \n" % offset)
+        self._file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self._offsets) + 1, xref))
+        self._file.close()
+
+    def _subset_font(self, obj):
+        """Object number of the merged version of an embedded TrueType subset, None for any other object."""
+        codes = _subset_codes(obj)
+        if codes is None:
+            return None
+        families = self._fonts.setdefault(str(obj["/BaseFont"]), [])
+        for family in families:
+            number, known, _ = family
+            if _extends(codes, known):
+                family[1:] = [codes, _copy(obj, _detach)]
+                return number
+            if _extends(known, codes):
+                return number
+        number = self._reserve()
+        families.append([number, codes, _copy(obj, _detach)])
+        return number
+
+    def _write_detached(self, detached):
+        number = self._reserve()
+        self._write(number, _copy(detached.obj, self._write_detached))
+        return IndirectObject(number, 0, None)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _write(self, number, obj):
+        self._offsets[number - 1] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % number)
+        obj.write_to_stream(self._file)
+        self._file.write(b"\nendobj\n")
+
+class _Detached(PdfObject):
+    """An object of a closed fragment kept in memory, written as its own indirect object."""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+def _detach(reference):
+    return _Detached(_copy(reference.get_object(), _detach))
+
+def _copy(obj, renumber):
+    """Copy ``obj``, replacing every reference (or detached object) with what ``renumber`` returns for it."""
+    if isinstance(obj, (IndirectObject, _Detached)):
+        return renumber(obj)
+    if isinstance(obj, StreamObject):
+        new = StreamObject()
+        new._data = obj._data
+        for key, value in obj.items():
+            new[NameObject(key)] = _copy(value, renumber)
+        return new
+    if isinstance(obj, DictionaryObject):
+        new = DictionaryObject()
+        for key, value in obj.items():
+            new[NameObject(key)] = _copy(value, renumber)
+        return new
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_copy(value, renumber) for value in obj)
+    return obj
+
+def _digest(obj, digest):
+    """Digest of ``obj``, with ``digest`` giving that of each object it references; None if one of them has none."""
+    hasher = hashlib.sha256()
+
+    def update(obj):
+        if isinstance(obj, IndirectObject):
+            value = digest(obj)
+            if value is None:
+                return False
+            hasher.update(b"R" + value)
+        elif isinstance(obj, DictionaryObject):
+            is_font = obj.get("/Type") == "/Font"
+            hasher.update(b"<<")
+            for key in sorted(obj.keys()):
+                # the resource name a font was written under is obsolete and differs between fragments
+                if is_font and key == "/Name":
+                    continue
+                hasher.update(key.encode() + b" ")
+                if not update(obj[key]):
+                    return False
+            hasher.update(b">>")
+            if isinstance(obj, StreamObject):
+                hasher.update(b"stream %d " % len(obj._data) + obj._data)
+        elif isinstance(obj, ArrayObject):
+            hasher.update(b"[")
+            for value in obj:
+                if not update(value):
+                    return False
+            hasher.update(b"]")
+        else:
+            hasher.update(f"{type(obj).__name__} {obj} ".encode())
+        return True
+
+    return hasher.digest() if update(obj) else None
+
+def _subset_codes(obj):
+    """Unicode code points of the glyph codes of an embedded TrueType subset, in code order; None for anything else."""
+    if not isinstance(obj, DictionaryObject) or obj.get("/Type") != "/Font" or obj.get("/Subtype") != "/TrueType":
+        return None
+    to_unicode = obj.get("/ToUnicode")
+    descriptor = obj.get("/FontDescriptor")
+    if to_unicode is None or descriptor is None or "/FontFile2" not in descriptor.get_object():
+        return None
+    cmap = to_unicode.get_object().get_data()
+    return tuple(int(code, 16) for code in re.findall(rb"<[0-9A-Fa-f]{2}> <([0-9A-Fa-f]{4,})>", cmap))
+
+def _extends(codes, known):
+    """Whether a subset with ``codes`` holds every glyph of one with ``known``, at the same codes.
+
+    Codes a subset has not assigned yet map to 0 (notdef), so they may be filled in later.
+    """
+    return len(codes) >= len(known) and all(old == 0 or old == new for new, old in zip(codes, known))
+
+def merge_fragments(fragments, output_file):
+    """Concatenate PDF fragments into one document, see ``FragmentMerger``.
+
+    Args:
+        fragments (list): Paths of the fragment PDFs, in page order
+        output_file (str): Path of the merged PDF
+    """
+    merger = FragmentMerger(output_file)
+    try:
+        for fragment in fragments:
+            merger.append(fragment)
+    finally:
+        merger.close()
+
+def page_count(fragment):
+    """Number of pages of a fragment PDF, read without loading their content."""
+    return len(PdfReader(fragment).pages)
@@ -1,19 +1,57 @@
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.utils import ImageReader
-from io import BytesIO
-import requests
 from tqdm import tqdm
-import time
 from constants import BLACK_COVER_IMG, BLACK_GRP_IMAGE
+from assets import get_assets
+from cache import ImageCache, DEFAULT_CACHE_DIR
+from crawler import FriendCrawler
+from posts import Message, PostStore, correspondents
+from transport import Transport
+from prefetch import ImagePrefetcher
+from snapshot import Snapshot, write_snapshot
+from sync import SyncStore, IncrementalFetcher
+from fragments import FragmentMerger, merge_fragments, page_count
+from imaging import DEFAULT_DPI, DEFAULT_QUALITY, target_pixels
+from layout import wrap_text, iter_blocks, plan_blocks
+from metrics import Metrics, Profiler
+from checkpoint import Checkpoint
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 import argparse
+import gc
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+import threading
+
+# distance from the separator line at the top of a message block to the first line of its content
+HEADER_HEIGHT = 85
+
+# sizes in points at which pictures are drawn, images are downscaled to them
+PROFILE_SIZE = (50, 50)
+COVER_SIZE = (letter[0] - 100, (letter[0] - 100) * 0.3)  # 10:3 aspect ratio
+GROUP_SIZE = ((letter[0] - 110) / 2, (letter[0] - 110) / 2 * (2 / 3))  # 3:2 aspect ratio
+
+# times one side of a message header has to be shown on a canvas before it is drawn as a form
+HEADER_FORM_MIN_USES = 2
+
+# reportlab reads this process-wide setting whenever it writes an image: binary streams instead of
+# ASCII85, which makes images a quarter larger and, without reportlab's C accelerator, re-encoding
+# the cover alone took ~0.1s per document. Set here so every canvas of this module gets it.
+rl_config.useA85 = 0
 
 class YearBook:
 
-    def __init__(self, username, password, include_friends=False, dark_mode=False):
+    def __init__(self, username, password, include_friends=False, dark_mode=False, image_cache=None, workers=8, transport=None, lookahead=32, sync_store=None, sync_max_age=0, event_callback=None,
+                 image_dpi=DEFAULT_DPI, image_quality=DEFAULT_QUALITY, friend_depth=1, max_friends=None, profile=None, post_store=None,
+                 checkpoint=None, background_friends=False):
         """Initialize the YearBook generator.
         
         Args:
@@ -21,10 +59,193 @@ class YearBook:
             password (str): Password for authentication
             include_friends (bool): Whether to include friends' messages
             dark_mode (bool): Whether to use dark mode color scheme
+            image_cache (ImageCache): Cache for profile and gallery images, a default on-disk one is used if None
+            workers (int): Number of concurrent requests used to crawl friends' messages
+            transport (Transport): HTTP layer used for every portal call, a pooled one sized by ``pool_size`` is used if None
+            lookahead (int): Number of images downloaded ahead of the renderer while generating the PDF
+            sync_store (SyncStore): Store of previous responses, enables conditional re-fetching of message lists
+            sync_max_age (float): Seconds a response in ``sync_store`` is reused without asking the portal again
+            event_callback (callable): Receives progress events, see ``set_event_callback``
+            image_dpi (float): Resolution images are downscaled to for their placement, None embeds the originals
+            image_quality (int): JPEG quality of downscaled images
+            friend_depth (int): Hops of the friend graph crawled, 1 includes only the people you exchanged messages with
+            max_friends (int): Largest number of friends crawled, None for no limit
+            profile (str): ``cpu`` or ``memory`` to profile fetching and rendering, see ``report``
+            post_store (PostStore): Store shared with other yearbooks; friends whose lists it already holds are not fetched again
+            checkpoint (Checkpoint): Work directory every crawled friend and rendered section is saved to, see ``generate_pdf``
+            background_friends (bool): Crawl friends on a background thread instead of before returning, so that
+                ``generate_pdf(stream=True)`` renders every friend's section as soon as it is fetched
+        """
+        self._configure(include_friends, dark_mode, image_cache if image_cache is not None else ImageCache(), workers, lookahead,
+                        image_dpi, image_quality, profile)
+        if post_store is not None:
+            self.posts = post_store
+        self.event_callback = event_callback
+        self.checkpoint = checkpoint
+        self.background_friends = background_friends
+        self.friend_depth = friend_depth
+        self.max_friends = max_friends
+        self.transport = transport if transport is not None else Transport(pool_size=pool_size(workers, background_friends))
+        # message lists and the gallery go through the incremental fetcher when a store is given
+        self.api = IncrementalFetcher(self.transport, sync_store, sync_max_age) if sync_store is not None else self.transport
+        self.sync_report = self.api.report if sync_store is not None else None
+
+        with self._profiling():
+            self._fetch(username, password)
+
+    def _fetch(self, username, password):
+        """Authenticate and fetch your messages, gallery and, if included, your friends' messages."""
+        auth_payload = {"username": username, "password": password}
+
+        self._emit("fetch", 0, 5)
+        with self.metrics.timer("auth"):
+            response = self.transport.post_json("/api/authenticate/token/", auth_payload)
+            try:
+                tokens = response.json()
+                access_token = tokens['access']
+            except (ValueError, KeyError):
+                raise Exception("Invalid credentials. Please check your email and password.")
+
+            # the refresh token renews the access token when it expires during a long crawl
+            self.transport.set_token(access_token, tokens.get('refresh'))
+            self._emit("fetch", 1, 5)
+            self.userId = self.transport.get_json("/api/authenticate/current_user/")['id']
+            self._emit("fetch", 2, 5)
+
+        # Get your messages
+        with self.metrics.timer("fetch"):
+            # posts are parsed into compact records while the lists download
+            self.posts.set_written_for(self.userId, self.api.iter_json(f"/api/posts/others/{self.userId}"))
+            self.messagesForYou = self.posts.written_for(self.userId)
+            self._emit("fetch", 3, 5)
+            self.posts.set_written_by(self.userId, self.api.iter_json(f"/api/posts/my/{self.userId}"))
+            self.messagesByYou = self.posts.written_by(self.userId)
+            self._emit("fetch", 4, 5)
+            self.userPhotos = self.api.get_json(f"/api/authenticate/profile/{self.userId}/gallery/")
+            self._emit("fetch", 5, 5)
+
+        # Get friend messages only if include_friends is True
+        if self.include_friends and self.background_friends:
+            self._crawl_friends_in_background()
+        elif self.include_friends:
+            with self.metrics.timer("friends"):
+                self.friendMessages = self.get_friend_messages()
+        else:
+            self.friendMessages = []
+
+    def _crawl_friends_in_background(self):
+        """Start ``get_friend_messages`` on a thread that fills ``friendMessages`` as friends are visited."""
+        def crawl():
+            try:
+                with self.metrics.timer("friends"):
+                    self.get_friend_messages(self._friend_messages)
+            except Exception as e:
+                self._friends_error = e
+            finally:
+                with self._friends_changed:
+                    self._friends_crawling = False
+                    self._friends_changed.notify_all()
+
+        self._friends_crawling = True
+        self._friends_crawl = threading.Thread(target=crawl, name="friend-crawl", daemon=True)
+        self._friends_crawl.start()
+
+    @property
+    def friendMessages(self):
+        """The section data of every friend, in page order; waits for a background crawl to finish."""
+        self._join_friends()
+        return self._friend_messages
+
+    @friendMessages.setter
+    def friendMessages(self, friend_messages):
+        self._friend_messages = friend_messages
+
+    def _join_friends(self):
+        """Wait for a background friend crawl, raising what made it fail."""
+        if self._friends_crawl is not None:
+            self._friends_crawl.join()
+        if self._friends_error is not None:
+            error, self._friends_error = self._friends_error, None
+            raise error
+
+    @classmethod
+    def from_snapshot(cls, path, include_friends=None, dark_mode=False, workers=8, lookahead=32,
+                      image_dpi=DEFAULT_DPI, image_quality=DEFAULT_QUALITY, profile=None):
+        """Create a YearBook from a snapshot written by ``save_snapshot``, without any network access.
+
+        Args:
+            path (str): Path of the snapshot archive
+            include_friends (bool): Whether to include friends' messages, defaults to whatever the snapshot holds
+            dark_mode (bool): Whether to use dark mode color scheme
+            workers (int): Number of threads reading images from the snapshot while rendering
+            lookahead (int): Number of images read ahead of the renderer while generating the PDF
+            image_dpi (float): Resolution images are downscaled to for their placement, None embeds the originals
+            image_quality (int): JPEG quality of downscaled images
+            profile (str): ``cpu`` or ``memory`` to profile rendering, see ``report``
         """
+        snapshot = Snapshot(path)
+        data = snapshot.manifest
+        if include_friends is None:
+            include_friends = data['include_friends']
+        elif include_friends and not data['include_friends']:
+            raise ValueError(f"Snapshot {path} was fetched without friends' messages")
+
+        yb = cls.__new__(cls)
+        # the snapshot already holds every image, so there is nothing worth caching on disk
+        yb._configure(include_friends, dark_mode, ImageCache(cache_dir=None), workers, lookahead, image_dpi, image_quality, profile)
+        yb.transport = snapshot
+        yb.api = snapshot
+        yb.sync_report = None
+        yb.userId = data['userId']
+        if 'posts' in data:
+            yb.posts = PostStore.from_dict(data['posts'])
+            friends = data['friends']
+        else:
+            # version 1 snapshots hold every message list in full
+            for friend_data in data['friendMessages']:
+                yb.posts.set_written_by(friend_data['friend_id'], friend_data['messages_by'])
+                yb.posts.set_written_for(friend_data['friend_id'], friend_data['messages_for'])
+            yb.posts.set_written_for(yb.userId, data['messagesForYou'])
+            yb.posts.set_written_by(yb.userId, data['messagesByYou'])
+            friends = data['friendMessages']
+        yb.messagesForYou = yb.posts.written_for(yb.userId)
+        yb.messagesByYou = yb.posts.written_by(yb.userId)
+        yb.userPhotos = data['userPhotos']
+        yb.friendMessages = [yb.friend_view(f['friend_id'], f['friend_name']) for f in friends] if include_friends else []
+        return yb
+
+    def _configure(self, include_friends, dark_mode, image_cache, workers, lookahead, image_dpi=DEFAULT_DPI, image_quality=DEFAULT_QUALITY,
+                   profile=None):
+        """Set up the rendering state shared by fetched and snapshot-backed yearbooks."""
         self.progress_callback = None
+        self.event_callback = None
+        self.metrics = Metrics()
+        self.profiler = Profiler(profile) if profile else None
+        self.progress = 0
+        self.pages_rendered = 0
+        self.images_loaded = 0
+        self.images_total = 0
+        self._images_lock = threading.Lock()
         self.include_friends = include_friends
         self.dark_mode = dark_mode
+        self.image_cache = image_cache
+        self.workers = workers
+        self.lookahead = lookahead
+        self.posts = PostStore()
+        self.image_dpi = image_dpi
+        self.image_quality = image_quality
+        self.prefetcher = None
+        self.checkpoint = None
+        self._friend_messages = []
+        self._friends_crawl = None
+        self._friends_crawling = False
+        self._friends_error = None
+        self._friends_changed = threading.Condition()
+        self._header_forms = {}          # header key -> form name on the current canvas
+        self._headers_drawn = Counter()  # header key -> times drawn in full on the current canvas
+        self._section_headers = {}       # header key -> picture, for the sides shown in the current section
+        self._section_uses = Counter()   # header key -> times still to be drawn in the current section
+        self.font_subsets = None         # glyph numbering shared by the documents of one book, see generate_pdf
         
         # Set up colors based on mode
         if dark_mode:
@@ -35,232 +256,339 @@ class YearBook:
             self.text_color = colors.black  
             self.accent_color = colors.purple  # Keep purple as accent color
 
-        auth_url = "https://yearbook.sarc-iitb.org/api/authenticate/token/"
-        auth_payload = {"username": username, "password": password}
+        # the font and cover artwork are loaded once per process and shared by every yearbook
+        self.assets = get_assets(self.metrics)
 
-        response = requests.post(auth_url, json=auth_payload, headers={"Content-Type": "application/json"})
-        try:
-            access_token = response.json()['access']
-        except:
-            raise Exception("Invalid credentials. Please check your email and password.")
-        
-        self.auth_header = {"Authorization": f"Bearer {access_token}"}
-        self.userId = requests.get("https://yearbook.sarc-iitb.org/api/authenticate/current_user/", headers=self.auth_header).json()['id']
-        
-        # Get your messages
-        self.messagesForYou = requests.get(f"https://yearbook.sarc-iitb.org/api/posts/others/{self.userId}",headers=self.auth_header).json()
-        self.messagesByYou = requests.get(f"https://yearbook.sarc-iitb.org/api/posts/my/{self.userId}",headers=self.auth_header).json()
-        self.userPhotos = requests.get(f"https://yearbook.sarc-iitb.org/api/authenticate/profile/{self.userId}/gallery/", headers=self.auth_header).json()
-        
-        # Get friend messages only if include_friends is True
-        self.friendMessages = self.get_friend_messages() if include_friends else []
-        
-        self.progress = 0
-        pdfmetrics.registerFont(TTFont('Symbola', 'Symbola.ttf'))
+    def save_snapshot(self, path):
+        """Save the fetched data and every image it references to a snapshot archive.
+
+        Args:
+            path (str): Destination file, see ``from_snapshot`` to render from it
+        """
+        images = self.download_images()
+
+        write_snapshot(path, {
+            'base_url': self.transport.url(""),
+            'include_friends': self.include_friends,
+            'userId': self.userId,
+            'userPhotos': self.userPhotos,
+            # message lists are rebuilt from the post store, which holds every post once
+            'posts': self.posts.to_dict(),
+            'friends': [{'friend_id': f['friend_id'], 'friend_name': f['friend_name']} for f in self.friendMessages],
+        }, images)
+
+    def report(self):
+        """Where the time and memory of this yearbook went so far.
+
+        Returns:
+            dict: ``phases`` maps ``assets`` (only in the yearbook that loaded them), ``auth``, ``fetch``, ``friends``, ``image`` (one call per image load),
+            ``layout``, ``draw``, ``save``, ``merge`` and ``generate`` to their calls, total and longest
+            seconds; ``network`` holds the transport's per-endpoint request counts, failures, retries,
+            bytes and seconds; ``profile`` the profiler's results if one was requested
+        """
+        report = self.metrics.report()
+        stats_by_endpoint = getattr(self.transport, 'stats_by_endpoint', None)
+        report["network"] = stats_by_endpoint() if stats_by_endpoint else {}
+        report["messages"] = self.total_messages()
+        report["images"] = self.images_loaded
+        report["pages"] = self.pages_rendered
+        if self.profiler is not None:
+            report["profile"] = self.profiler.report()
+        return report
+
+    def _profiling(self):
+        return self.profiler.running() if self.profiler is not None else nullcontext()
 
     def set_progress_callback(self, callback):
         self.progress_callback = callback
+
+    def set_event_callback(self, callback):
+        """Receive structured progress events.
+
+        ``callback(phase, done, total, **extra)`` is called for the phases ``fetch`` (authentication
+        and your own lists), ``friends`` (friends crawled), ``images`` (images loaded) and ``render``
+        (message blocks drawn, with ``pages`` rendered). Every event carries ``bytes``, the number
+        of bytes downloaded so far. It may be called from worker threads.
+        """
+        self.event_callback = callback
+
+    def _emit(self, phase, done, total, **extra):
+        if self.event_callback is not None:
+            summary = getattr(self.transport, 'summary', None) if hasattr(self, 'transport') else None
+            self.event_callback(phase, done, total, bytes=summary()['bytes'] if summary else 0, **extra)
+
+    def get_image(self, image_url, size):
+        """Get a shared ImageReader for a portal-relative image path drawn ``size`` points large, downloading it at most once."""
+        if self.prefetcher is not None:
+            return self.prefetcher.take((image_url, size))
+        return self.load_image(image_url, size)
+
+    def load_image(self, image_url, size):
+        """Download, downscale and decode an image, this runs on the prefetch threads while rendering."""
+        url, pixels, quality = self._image_lookup(image_url, size)
+        # the cache hands out decoded readers, so drawImage finds the pixel data ready
+        with self.metrics.timer("image"):
+            image = self.image_cache.get(url, self.transport.get_bytes, pixels, quality)
+        with self._images_lock:
+            self.images_loaded += 1
+            loaded = self.images_loaded
+        self._emit("images", loaded, self.images_total)
+        return image
+
+    def _image_lookup(self, image_url, size):
+        """``(url, size in pixels, quality)`` the image cache is asked for to draw an image at ``size`` points."""
+        pixels = target_pixels(size, self.image_dpi) if self.image_dpi else None
+        return self.transport.url(image_url), pixels, self.image_quality
+
+    def _release_images(self, sections):
+        """Drop the decoded images of ``sections`` once they are on disk, keeping those of other yearbooks sharing the cache."""
+        self.image_cache.release([self._image_lookup(*placement) for placement in self.image_placements(sections)])
+        # the canvas and image readers form reference cycles, so collect them right away
+        gc.collect()
+
+    def get_image_bytes(self, image_url):
+        """Get the raw bytes for a portal-relative image path, downloading them at most once."""
+        return self.image_cache.get_bytes(self.transport.url(image_url), self.transport.get_bytes)
     
-    def add_message_block(self, c, message, y_position):
+    def add_message_block(self, c, message, y_position, lines, header=True):
+        """Draw a message block, or the part of it that was planned onto the current page.
+
+        Args:
+            c (Canvas): Canvas to draw on
+            message (Message): The message
+            y_position (float): Top of the block, or the baseline of the first line if ``header`` is False
+            lines (list): Wrapped content lines to draw here
+            header (bool): Whether to draw the separator, profile pictures, names and departments
+        """
+        if header:
+            self._draw_message_header(c, message, y_position)
+            y_position -= HEADER_HEIGHT
+
+        # Written Content
+        c.setFont("Symbola",12)
+        text_object = c.beginText(60, y_position)
+        text_object.setFont("Symbola", 12)
+        text_object.setFillColor(self.text_color)
+        for line in lines:
+            text_object.textLine(line)
+        c.drawText(text_object)
+
+    def _draw_message_header(self, c, message, y_position):
         width, height = letter
 
         c.setStrokeColor(self.accent_color)
         c.setLineWidth(1)
         c.line(50, y_position, width - 50, y_position)
 
-        # Left Profile
-        try: 
-            profile_image_url = message['written_by_profile']['profile_image']
-            if profile_image_url:
-                response = requests.get("https://yearbook.sarc-iitb.org" + profile_image_url, headers=self.auth_header)
-                profile_img = ImageReader(BytesIO(response.content))
-                c.drawImage(profile_img, 60, y_position - 60, 50, 50)
-        except:
-            # skip for messages from anonymous users
-            time.sleep(0)
-
-        # Right Profile
-        profile_image_url = message['written_for_profile']['profile_image']
-        if profile_image_url:
-            response = requests.get("https://yearbook.sarc-iitb.org" + profile_image_url, headers=self.auth_header)
-            profile_img = ImageReader(BytesIO(response.content))
-            c.drawImage(profile_img, width - 260, y_position - 60, 50, 50)
+        # a person shown again is drawn from a form XObject, see _draw_header_side
+        c.saveState()
+        c.translate(0, y_position)
+        self._draw_header_side(c, 'by', message)
+        self._draw_header_side(c, 'for', message)
+        c.restoreState()
+
+    def _draw_header_side(self, c, side, message):
+        """Draw one side of a message header below the origin.
+
+        A side shown at least ``HEADER_FORM_MIN_USES`` times on a canvas, counting the ones drawn
+        so far and the ones left in the current section, is drawn once into a form XObject and
+        referenced from then on; a form costs more than a few inline drawings, so rarer sides are
+        drawn in full. Sides are keyed by ``_header_key``. The picture is taken from the prefetcher
+        the first time a side comes up in a section, in step with ``image_placements``.
+        """
+        key = _header_key(side, message)
+        if key not in self._section_headers:
+            self._section_headers[key] = self._header_image(side, message)
+        image = self._section_headers[key]
+
+        name = self._header_forms.get(key)
+        if name is None and self._headers_drawn[key] + self._section_uses[key] >= HEADER_FORM_MIN_USES:
+            name = f"header{len(self._header_forms)}"
+            c.beginForm(name, lowery=-HEADER_HEIGHT)
+            self._draw_person(c, side, message, image)
+            c.endForm()
+            self._header_forms[key] = name
+        self._section_uses[key] -= 1
+        if name is not None:
+            c.doForm(name)
+        else:
+            self._headers_drawn[key] += 1
+            self._draw_person(c, side, message, image)
+
+    def _header_image(self, side, message):
+        if side == 'for':
+            return self.get_image(message.written_for_image, PROFILE_SIZE) if message.written_for_image else None
+        try:
+            return self.get_image(message.written_by_image, PROFILE_SIZE) if message.written_by_image else None
+        except Exception as e:
+            print(f"Warning: Could not load the picture of {message.written_by}: {str(e)}")
+            return None
+
+    def _draw_person(self, c, side, message, image):
+        """Draw one side of a message header below the origin: picture, name, department and year."""
+        width, height = letter
+        if side == 'by':
+            x, image_x, name = 120, 60, "From: " + message.written_by
+            dept, year = message.written_by_dept, message.written_by_year
+            # for anonymous users, these fields are not present
+            details = _department_lines(dept, year, 'and') if dept != "None" and year != "None" else []
+        else:
+            x, image_x, name = width - 200, width - 260, "To: " + message.written_for
+            details = _department_lines(message.written_for_dept, message.written_for_year, ' and ')
+
+        if image is not None:
+            c.drawImage(image, image_x, -60, *PROFILE_SIZE)
 
         # Names and details
-        written_by = "From: " + message['written_by']
-        written_for = "To: " + message['written_for']
         c.setFont("Helvetica-Bold", 12)
         c.setFillColor(self.accent_color)
-        c.drawString(120, y_position - 20, f"{written_by}")
-        c.drawString(width - 200, y_position - 20, f"{written_for}")
+        c.drawString(x, -20, name)
 
         c.setFont("Helvetica", 10)
         c.setFillColor(self.text_color)
-        if message['written_by_dept'] != "None" and message['written_by_year'] != "None":
-            # for anonymous users, these fields are not present
-            if '&' in message["written_by_dept"]:
-                p = message["written_by_dept"].split('&')
-                c.drawString(120, y_position - 40, f"{p[0]}")
-                c.drawString(120, y_position - 55, f"{'&' + p[1]}")
-                c.drawString(120, y_position - 70, f"{message['written_by_year']}")
-            elif 'and' in message["written_by_dept"]:
-                p = message["written_by_dept"].split('and')
-                c.drawString(120, y_position - 40, f"{p[0]}")
-                c.drawString(120, y_position - 55, f"{'and' + p[1]}")
-                c.drawString(120, y_position - 70, f"{message['written_by_year']}")
-            else:
-                c.drawString(120, y_position - 40, f"{message['written_by_dept']}")
-                c.drawString(120, y_position - 55, f"{message['written_by_year']}")
-        
-        if '&' in message["written_for_dept"]:
-            p = message["written_for_dept"].split('&')
-            c.drawString(width - 200, y_position - 40, f"{p[0]}")
-            c.drawString(width - 200, y_position - 55, f"{'&' + p[1]}")
-            c.drawString(width - 200, y_position - 70, f"{message['written_for_year']}")
-        elif ' and ' in message["written_for_dept"]:
-            p = message["written_for_dept"].split('and')
-            c.drawString(width - 200, y_position - 40, f"{p[0]}")
-            c.drawString(width - 200, y_position - 55, f"{'and' + p[1]}")
-            c.drawString(width - 200, y_position - 70, f"{message['written_for_year']}")
-        else:
-            c.drawString(width - 200, y_position - 40, f"{message['written_for_dept']}")
-            c.drawString(width - 200, y_position - 55, f"{message['written_for_year']}")
+        for i, line in enumerate(details):
+            c.drawString(x, -40 - 15 * i, line)
 
+    def image_urls(self):
+        """Yield every image path in the order generate_pdf draws them."""
+        for image_url, _ in self.image_placements():
+            yield image_url
 
-        # Written Content
-        c.setFont("Symbola",12)
-        content = message['content']
-        text_object = c.beginText(60, y_position - 85)
-        text_object.setFont("Symbola", 12)
-        text_object.setFillColor(self.text_color)
-        max_width = width - 120
-        content_height = 0 
-        current_y_position = y_position - 85
-
-        for line in content.splitlines():
-            words = line.split()
-            current_line = ""
-
-            for word in words:
-                test_line = current_line + word + " "
-                if c.stringWidth(test_line) <= max_width:
-                    current_line = test_line
-                else:
-                    text_object.textLine(current_line.strip())
-                    content_height += 12
-                    current_y_position -= 12
-
-                    if current_y_position < 50:
-                        c.drawText(text_object)
-                        c.showPage()
-                        if self.dark_mode:
-                            c.setFillColor(self.bg_color)
-                            c.rect(0, 0, width, height, fill=1)
-                        text_object = c.beginText(60, height - 50)
-                        text_object.setFont("Symbola", 12)
-                        text_object.setFillColor(self.text_color)
-                        current_y_position = height - 50
-
-                    current_line = word + " "
-
-            if current_line:
-                text_object.textLine(current_line.strip())
-                content_height += 12
-                current_y_position -= 12
-
-                if current_y_position < 50:
-                    c.drawText(text_object)
-                    c.showPage()
-                    if self.dark_mode:
-                        c.setFillColor(self.bg_color)
-                        c.rect(0, 0, width, height, fill=1)
-                    text_object = c.beginText(60, height - 50)
-                    text_object.setFont("Symbola", 12)
-                    text_object.setFillColor(self.text_color)
-                    current_y_position = height - 50
+    def image_placements(self, sections=None):
+        """Yield ``(image path, size in points)`` for every image in the order generate_pdf draws them.
 
-        c.drawText(text_object)
+        Args:
+            sections (list): Only the images of these sections, every section of the book if None
+        """
+        sections = self.sections() if sections is None else sections
+        if ('front', None) in sections and isinstance(self.userPhotos, dict):
+            if self.userPhotos.get("cover"):
+                yield self.userPhotos["cover"], COVER_SIZE
+            for t in self.userPhotos:
+                if t.startswith("img"):
+                    yield self.userPhotos[t], GROUP_SIZE
 
-        return current_y_position - 50
+        for section in sections:
+            # the picture of a header side is taken once per section, see _draw_header_side
+            seen = set()
+            for messages in self._section_lists(section):
+                for message in messages:
+                    for side, profile_image in (('by', message.written_by_image), ('for', message.written_for_image)):
+                        key = _header_key(side, message)
+                        if key not in seen:
+                            seen.add(key)
+                            if profile_image:
+                                yield profile_image, PROFILE_SIZE
 
     def get_friend_ids(self):
         """Get unique IDs of friends (people who have written to you or you have written to)."""
-        friend_ids = set()
-        
-        # Add people who have written to you
-        for message in self.messagesForYou:
-            try:
-                # The profile ID is directly in the profile object
-                friend_id = message['written_by_profile']['user']
-                friend_ids.add(friend_id)
-            except (KeyError, IndexError) as e:
-                print(f"Warning: Could not get friend ID from message. Error: {str(e)}")
-                continue
-        
-        # Add people you have written to
-        for message in self.messagesByYou:
-            try:
-                # The profile ID is directly in the profile object
-                friend_id = message['written_for_profile']['user']
-                friend_ids.add(friend_id)
-            except (KeyError, IndexError) as e:
-                print(f"Warning: Could not get friend ID from message. Error: {str(e)}")
-                continue
-        
+        friend_ids = correspondents(self.messagesForYou, self.messagesByYou)
         print(f"Found {len(friend_ids)} unique friends")
-        # print(f"Returning only first two for now")
-        return list(friend_ids)
+        return friend_ids
+
+    def get_friend_messages(self, friend_messages=None):
+        """Crawl the friend graph into the post store and return a view of every friend found.
+
+        Friends are crawled breadth first up to ``friend_depth`` hops away and at most
+        ``max_friends`` of them, see ``FriendCrawler.crawl_graph``. Friends that failed are
+        retried at the end of their hop; with a ``checkpoint``, every friend is saved as soon
+        as it is crawled and friends saved by an earlier run are not fetched again.
 
-    def get_friend_messages(self):
-        """Get messages written by and for each friend."""
+        Args:
+            friend_messages (list): List every view is appended to as soon as its friend is visited, a new one if None
+        """
         friend_ids = self.get_friend_ids()
-        friend_messages = []
-        
-        for friend_id in friend_ids:
+        friend_messages = [] if friend_messages is None else friend_messages
+        unchanged_friends = 0
+        known_friends = 0
+        resumed_friends = 0
+        failed_friends = []
+        saved = set()
+
+        def known(friend_id):
+            nonlocal known_friends, resumed_friends
+            # another yearbook sharing the post store crawled this friend already
+            if self.posts.crawled(friend_id):
+                known_friends += 1
+                return self.posts.written_by(friend_id), self.posts.written_for(friend_id)
+            lists = self.checkpoint.friend(friend_id) if self.checkpoint is not None else None
+            if lists is not None:
+                resumed_friends += 1
+                saved.add(friend_id)
+            return lists
+
+        def visit(friend_id, messages_by_friend, messages_for_friend, error):
+            nonlocal unchanged_friends
             try:
-                # Get messages written by the friend
-                messages_by_friend = requests.get(f"https://yearbook.sarc-iitb.org/api/posts/my/{friend_id}", 
-                                               headers=self.auth_header).json()
-                
-                # Get messages written for the friend
-                messages_for_friend = requests.get(f"https://yearbook.sarc-iitb.org/api/posts/others/{friend_id}", 
-                                                headers=self.auth_header).json()
-                
-                # Add friend's profile info to each message
-                friend_profile = None
+                if error is not None:
+                    failed_friends.append(friend_id)
+                    raise error
+                if self.checkpoint is not None and friend_id not in saved:
+                    self.checkpoint.save_friend(friend_id, messages_by_friend, messages_for_friend)
+                if self.sync_report is not None and not (self.sync_report.changed(f"/api/posts/my/{friend_id}")
+                                                         or self.sync_report.changed(f"/api/posts/others/{friend_id}")):
+                    unchanged_friends += 1
+
+                self.posts.set_written_by(friend_id, messages_by_friend)
+                self.posts.set_written_for(friend_id, messages_for_friend)
+
+                # Take the friend's name from their profile
                 friend_name = None
-                
                 if messages_by_friend:
-                    friend_profile = messages_by_friend[0]['written_by_profile']
-                    friend_name = friend_profile.get('name', 'Unknown')
+                    friend_name = messages_by_friend[0].written_by_name or 'Unknown'
                 elif messages_for_friend:
-                    friend_profile = messages_for_friend[0]['written_for_profile']
-                    friend_name = friend_profile.get('name', 'Unknown')
-                
+                    friend_name = messages_for_friend[0].written_for_name or 'Unknown'
+
                 if friend_name:
-                    friend_messages.append({
-                        'friend_id': friend_id,
-                        'friend_name': friend_name,
-                        'messages_by': messages_by_friend,
-                        'messages_for': messages_for_friend
-                    })
+                    with self._friends_changed:
+                        friend_messages.append(self.friend_view(friend_id, friend_name))
+                        self._friends_changed.notify_all()
             except Exception as e:
                 print(f"Warning: Error processing friend {friend_id}: {str(e)}")
-                continue
-        
+                return []
+            return [user_id for user_id in correspondents(messages_for_friend, messages_by_friend) if user_id != self.userId]
+
+        crawler = FriendCrawler(self._fetch_messages, workers=self.workers)
+        self._emit("friends", 0, len(friend_ids))
+        progress = lambda done, total: self._emit("friends", done, total)
+        crawled = crawler.crawl_graph(friend_ids, visit, depth=self.friend_depth, budget=self.max_friends, progress=progress,
+                                      known=known)
+        self.metrics.count("friends_known", known_friends)
+        self.metrics.count("friends_resumed", resumed_friends)
+        self.metrics.count("friends_failed", len(failed_friends))
+
+        print(f"Crawled {crawled} friends, {len(self.posts)} unique messages")
+        if resumed_friends:
+            print(f"{resumed_friends} friends taken from the checkpoint of an earlier run")
+        if failed_friends:
+            print(f"Warning: {len(failed_friends)} friends could not be fetched and are left out: "
+                  f"{', '.join(str(friend_id) for friend_id in failed_friends)}")
+        if self.sync_report is not None:
+            print(f"{unchanged_friends} of {crawled} friends unchanged since the last sync")
         return friend_messages
 
-    def add_friend_intro_page(self, c, friend_data):
+    def _fetch_messages(self, path):
+        """The posts of a message list as ``Message`` records, converted one by one as the list downloads."""
+        return [Message.from_post(post) for post in self.api.iter_json(path)]
+
+    def friend_view(self, friend_id, friend_name):
+        """The section data of one friend; the message lists share their posts with the post store."""
+        return {
+            'friend_id': friend_id,
+            'friend_name': friend_name,
+            'messages_by': self.posts.written_by(friend_id),
+            'messages_for': self.posts.written_for(friend_id),
+        }
+
+    def add_friend_intro_page(self, c, friend_data, new_page=True):
         """Add an introduction page - just a centered title."""
         width, height = letter
         
-        # Start a new page
-        c.showPage()
-        
-        # Add dark background if in dark mode
-        if self.dark_mode:
-            c.setFillColor(self.bg_color)
-            c.rect(0, 0, width, height, fill=1)
+        # Start a new page, with a dark background if in dark mode
+        if new_page:
+            self._new_page(c)
+        else:
+            self._paint_background(c)
         
         # Add centered title
         c.setFont("Helvetica-Bold", 30)
@@ -283,18 +611,345 @@ class YearBook:
         c.setLineWidth(1)
         c.line(50, height/2 - 50, width - 50, height/2 - 50)
 
-    def generate_pdf(self, output_file):
+    def generate_pdf(self, output_file, processes=1, stream=False):
         """Generate the yearbook PDF.
         
         Args:
             output_file (str): Path to save the PDF file
+            processes (int): Number of processes rendering sections in parallel, 1 renders everything in this process
+            stream (bool): Write every finished section to disk and free it, keeping memory flat for huge books
+
+        With a ``checkpoint``, every section is rendered to a fragment in its work directory
+        and the fragments are merged at the end, so a rerun only renders the sections that
+        are missing. With ``stream`` and ``background_friends``, rendering starts while
+        friends are still being crawled and totals grow as they arrive; every other mode
+        waits for the crawl first.
+        """
+        parallel = processes > 1 and self._can_render_in_workers()
+        streaming = stream and self.checkpoint is None and not parallel
+        if not streaming:
+            self._join_friends()
+        self.progress_bar = tqdm(total=self.total_messages())
+        # streaming counts the images of every section as it gets to it
+        self.images_total = 0 if streaming else sum(1 for _ in self.image_urls())
+        # every section saved as its own document numbers the glyphs of the body font alike, so merging
+        # keeps one copy of each subset; numbered up front when the whole book is known, see FontSubsets
+        self.font_subsets = self.assets.font_subsets("" if streaming else self._characters(self.sections()))
+        self._emit("images", 0, self.images_total)
+        self._emit("render", 0, self.total_messages(), pages=0)
+        try:
+            with self._profiling(), self.metrics.timer("generate"):
+                if self.checkpoint is not None:
+                    self._generate_checkpointed(output_file, self.sections(), processes)
+                elif parallel:
+                    self._generate_parallel(output_file, self.sections(), processes)
+                elif streaming:
+                    self._generate_streaming(output_file, self._iter_sections())
+                else:
+                    self._generate_serial(output_file, self.sections())
+        finally:
+            self.progress_bar.close()
+
+    def _generate_serial(self, output_file, sections):
+        with self._prefetching():
+            self._render(output_file, sections)
+
+    def _generate_streaming(self, output_file, sections):
+        """Render one section at a time and stream it into the output file as soon as it is done.
+
+        ``sections`` may still be growing while a background crawl runs, see ``_iter_sections``,
+        so the image and message totals are extended section by section.
+        """
+        work_dir = tempfile.mkdtemp(prefix="yearbook-")
+        merger = FragmentMerger(output_file)
+        try:
+            for i, section in enumerate(sections):
+                self.images_total += sum(1 for _ in self.image_placements([section]))
+                self.progress_bar.total = self.total_messages()
+                self.progress_bar.refresh()
+                fragment = os.path.join(work_dir, f"{i:05d}.pdf")
+                with self._prefetching([section]):
+                    self._render(fragment, [section])
+                # the section is on disk now, drop the decoded images it held on to
+                self._release_images([section])
+                with self.metrics.timer("merge"):
+                    merger.append(fragment)
+                os.remove(fragment)
+        finally:
+            merger.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _generate_checkpointed(self, output_file, sections, processes):
+        """Render the sections missing from the checkpoint to their fragments and merge all of them in order."""
+        render_options = {'dark_mode': self.dark_mode, 'image_dpi': self.image_dpi, 'image_quality': self.image_quality}
+        fragments = [self.checkpoint.fragment(self._section_key(section), render_options) for section in sections]
+        pending = [(section, fragment) for section, fragment in zip(sections, fragments) if not os.path.exists(fragment)]
+        if len(pending) < len(sections):
+            print(f"{len(sections) - len(pending)} of {len(sections)} sections taken from the checkpoint of an earlier run")
+            self.pages_rendered += sum(page_count(fragment) for fragment in fragments if os.path.exists(fragment))
+            self._advance(self.total_messages() - sum(self.section_messages(section) for section, _ in pending))
+        self.images_total = sum(1 for _ in self.image_placements([section for section, _ in pending]))
+        self._emit("images", 0, self.images_total)
+
+        if processes > 1 and len(pending) > 1 and self._can_render_in_workers():
+            self._render_parallel(pending, processes)
+        elif pending:
+            with self._prefetching([section for section, _ in pending]):
+                for section, fragment in pending:
+                    # a fragment only gets its name once it is complete
+                    self._render(fragment + ".tmp", [section])
+                    os.replace(fragment + ".tmp", fragment)
+                    self._release_images([section])
+        with self.metrics.timer("merge"):
+            merge_fragments(fragments, output_file)
+
+    def _section_key(self, section):
+        """Name of a section that stays the same across runs as long as its content does.
+
+        The name is the section kind (with the friend ID, unlike the index) plus a digest of
+        everything the section shows, so a section whose messages changed since a checkpoint,
+        e.g. your own lists that are fetched again on resume, is rendered again.
         """
+        kind, index = section
+        content = [[message.to_post() for message in messages] for messages in self._section_lists(section)]
+        if kind == 'front':
+            content.append(self.userPhotos)
+        digest = hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:12]
+        name = f"friend-{self._friend_messages[index]['friend_id']}" if kind == 'friend' else kind
+        return f"{name}-{digest}"
+
+    def _render(self, output_file, sections):
         c = canvas.Canvas(output_file, pagesize=letter)
+        if self.font_subsets is not None:
+            self.assets.font.share(c._doc, self.font_subsets)
+        # header forms belong to the canvas they were defined on
+        self._header_forms = {}
+        self._headers_drawn = Counter()
+        for i, section in enumerate(sections):
+            with self.metrics.timer("draw"):
+                self.draw_section(c, section, new_page=i > 0)
+        with self.metrics.timer("save"):
+            c.save()
+        # saving closes the last page, which no page break counted
+        self.pages_rendered += 1
+        self._emit("render", self.progress, self.total_messages(), pages=self.pages_rendered)
+
+    @contextmanager
+    def _prefetching(self, sections=None):
+        """Download the images of ``sections`` (all if None) ahead of the renderer for as long as the context is open."""
+        self.prefetcher = ImagePrefetcher(lambda placement: self.load_image(*placement), self.image_placements(sections),
+                                          workers=self.workers, lookahead=self.lookahead)
+        try:
+            yield self.prefetcher
+        finally:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def _can_render_in_workers(self):
+        """Worker processes read images from the snapshot or the on-disk cache, so one of them is needed."""
+        return isinstance(self.transport, Snapshot) or self.image_cache.cache_dir is not None
+
+    def _generate_parallel(self, output_file, sections, processes):
+        """Render every section to its own PDF fragment in a process pool and merge them in order."""
+        work_dir = tempfile.mkdtemp(prefix="yearbook-")
+        try:
+            fragments = [os.path.join(work_dir, f"{i:05d}.pdf") for i in range(len(sections))]
+            self._render_parallel(list(zip(sections, fragments)), processes)
+            with self.metrics.timer("merge"):
+                merge_fragments(fragments, output_file)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _render_parallel(self, jobs, processes):
+        """Render ``(section, fragment path)`` jobs in a process pool; every fragment is renamed into place once complete."""
+        if not isinstance(self.transport, Snapshot):
+            # download everything once up front, the workers then only read the disk cache
+            self.download_images([section for section, _ in jobs])
+
+        characters = self._characters(self.sections())
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                                 initargs=(self._worker_source(),)) as pool:
+            futures = {
+                pool.submit(_render_fragment, self._worker_state(section, characters), fragment + ".tmp"): (section, fragment)
+                for section, fragment in jobs
+            }
+            for future in as_completed(futures):
+                pages, images = future.result()
+                section, fragment = futures[future]
+                os.replace(fragment + ".tmp", fragment)
+                # the workers drew the pages and loaded the images, count them here
+                self.pages_rendered += pages
+                with self._images_lock:
+                    self.images_loaded += images
+                    loaded = self.images_loaded
+                self._emit("images", loaded, self.images_total)
+                self._advance(self.section_messages(section))
+
+    def _worker_source(self):
+        """Where worker processes read images from, see ``_init_worker``."""
+        snapshot = isinstance(self.transport, Snapshot)
+        return {
+            'snapshot': self.transport.path if snapshot else None,
+            'cache_dir': self.image_cache.cache_dir,
+            'base_url': self.transport.url(""),
+            'authorization': None if snapshot else self.transport.session.headers.get("Authorization"),
+        }
+
+    def _worker_state(self, section, characters):
+        """Everything a worker process needs to render ``section``, kept to the section's own data.
+
+        ``characters`` are those of the whole book, so that every worker numbers the glyphs alike.
+        """
+        kind, index = section
+        return {
+            'section': (kind, 0 if kind == 'friend' else index),
+            'characters': characters,
+            'dark_mode': self.dark_mode,
+            'image_dpi': self.image_dpi,
+            'image_quality': self.image_quality,
+            'userPhotos': self.userPhotos if kind == 'front' else {},
+            'messagesForYou': self.messagesForYou if kind == 'front' else [],
+            'messagesByYou': self.messagesByYou if kind == 'by_you' else [],
+            'friendMessages': [self._friend_messages[index]] if kind == 'friend' else [],
+        }
+
+    def download_images(self, sections=None):
+        """Download every image the book references into the image cache.
+
+        Args:
+            sections (list): Only the images of these sections, every section of the book if None
+
+        Returns:
+            dict: Absolute image URL -> image bytes, empty for images that could not be downloaded
+        """
+        urls = list(dict.fromkeys(self.transport.url(t) for t, _ in self.image_placements(sections)))
+
+        def fetch(url):
+            try:
+                return self.image_cache.get_bytes(url, self.transport.get_bytes)
+            except Exception as e:
+                print(f"Warning: Could not download image {url}: {str(e)}")
+                return b""
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(zip(urls, pool.map(fetch, urls)))
+
+    def sections(self):
+        """Split the book into sections that each start on a fresh page, in page order.
+
+        Returns:
+            list: ``(kind, index)`` tuples, kind is ``front`` (cover, gallery and messages for you),
+            ``by_you`` or ``friend`` with ``index`` into ``friendMessages``
+        """
+        sections = [('front', None), ('by_you', None)]
+        if self.include_friends:
+            for i, friend_data in enumerate(self.friendMessages):
+                if friend_data['messages_by'] or friend_data['messages_for']:
+                    sections.append(('friend', i))
+        return sections
+
+    def _iter_sections(self):
+        """Yield the sections of ``sections``, each friend's as soon as a background crawl visited it."""
+        yield ('front', None)
+        yield ('by_you', None)
+        if not self.include_friends:
+            return
+        index = 0
+        while True:
+            with self._friends_changed:
+                while index >= len(self._friend_messages) and self._friends_crawling:
+                    self._friends_changed.wait()
+                if index >= len(self._friend_messages):
+                    break
+                friend_data = self._friend_messages[index]
+            if friend_data['messages_by'] or friend_data['messages_for']:
+                yield ('friend', index)
+            index += 1
+        self._join_friends()
+
+    def _characters(self, sections):
+        """Every character the messages of ``sections`` draw in the body font, sorted."""
+        characters = set()
+        for section in sections:
+            for messages in self._section_lists(section):
+                for message in messages:
+                    characters.update(message.content)
+        return "".join(sorted(ch for ch in characters if not ch.isspace()))
+
+    def section_messages(self, section):
+        """Number of message blocks drawn by ``section``."""
+        return sum(len(messages) for messages in self._section_lists(section))
+
+    def _section_lists(self, section):
+        """The message lists ``section`` draws, in order."""
+        kind, index = section
+        if kind == 'front':
+            return [self.messagesForYou]
+        if kind == 'by_you':
+            return [self.messagesByYou]
+        friend_data = self._friend_messages[index]
+        return [friend_data['messages_by'], friend_data['messages_for']]
+
+    def total_messages(self):
+        """Number of message blocks in the whole book, used for progress reporting; grows during a background crawl."""
+        total_messages = len(self.messagesForYou) + len(self.messagesByYou)
+        if self.include_friends:
+            for friend_data in list(self._friend_messages):
+                total_messages += len(friend_data['messages_by']) + len(friend_data['messages_for'])
+        return total_messages
+
+    def draw_section(self, c, section, new_page=True):
+        """Draw one section of the book.
+
+        Args:
+            c (Canvas): Canvas to draw on
+            section (tuple): Section as returned by ``sections``
+            new_page (bool): Whether to start a new page first, False when the canvas is still on a blank page
+        """
+        kind, index = section
+        self._section_headers = {}
+        self._section_uses = Counter(_header_key(side, message) for messages in self._section_lists(section)
+                                     for message in messages for side in ('by', 'for'))
+        if kind == 'front':
+            self._draw_front(c)
+        elif kind == 'by_you':
+            if new_page:
+                self._new_page(c)
+            else:
+                self._paint_background(c)
+            c.setFont("Helvetica-Bold", 20)
+            c.setFillColor(self.accent_color)
+            c.drawString(175, 750, "What you wrote for others")
+            self._draw_messages(c, self.messagesByYou, 720)
+        else:
+            friend_data = self._friend_messages[index]
+            # Add friend introduction page
+            self.add_friend_intro_page(c, friend_data, new_page=new_page)
+
+            # Messages written by the friend
+            if friend_data['messages_by']:
+                self._new_page(c)
+                c.setFont("Helvetica-Bold", 16)
+                c.setFillColor(self.accent_color)
+                c.drawString(175, 750, f"Messages written by {friend_data['friend_name']}")
+                self._draw_messages(c, friend_data['messages_by'], 720)
+
+            # Messages written for the friend
+            if friend_data['messages_for']:
+                self._new_page(c)
+                c.setFont("Helvetica-Bold", 16)
+                c.setFillColor(self.accent_color)
+                c.drawString(175, 750, f"Messages written for {friend_data['friend_name']}")
+                self._draw_messages(c, friend_data['messages_for'], 720)
+
+    def _draw_front(self, c):
+        """Draw the cover page, the gallery and the messages written for you."""
         width, height = letter
 
         # cover page
-        c.drawImage('iitb_bg.jpg', 0, -2, width=width+3, height=height+2,mask='auto')
-        c.drawImage('iitb-logo.png', width-77, height-77, 70, 70, mask='auto')
+        c.drawImage(self.assets.background, 0, -2, width=width+3, height=height+2,mask='auto')
+        c.drawImage(self.assets.logo, width-77, height-77, 70, 70, mask='auto')
 
         c.setFillColor(colors.white)
         c.setFillAlpha(0.3)
@@ -305,12 +960,7 @@ class YearBook:
         c.drawString(100, 396, "Yearbook - Your College Memories")
         c.setFont("Helvetica-Bold", 15)
         c.drawString(100, 376, "Late Nights, Deadlines, and Dreams - A Stroll through time")
-        c.showPage()
-
-        # Add dark background if in dark mode
-        if self.dark_mode:
-            c.setFillColor(self.bg_color)
-            c.rect(0, 0, width, height, fill=1)
+        self._new_page(c)
 
         imagesInserted = False
         coverPhotoInserted = False
@@ -318,14 +968,12 @@ class YearBook:
         userPhotos = self.userPhotos
 
         try:
-            coverImageURL = "https://yearbook.sarc-iitb.org" + userPhotos["cover"]
-            response = requests.get(coverImageURL, headers=self.auth_header)
-            if response.content != BLACK_COVER_IMG:
-                coverImage = ImageReader(BytesIO(response.content))
-                c.drawImage(coverImage, 50, 545, width - 100, (width - 100)*0.3) # 10:3 aspect ratio
+            if self.get_image_bytes(userPhotos["cover"]) != BLACK_COVER_IMG:
+                coverImage = self.get_image(userPhotos["cover"], COVER_SIZE)
+                c.drawImage(coverImage, 50, 545, *COVER_SIZE)
                 coverPhotoInserted = True
-            groupImageRawData = [requests.get("https://yearbook.sarc-iitb.org" + userPhotos[t], headers=self.auth_header).content for t in userPhotos if t.startswith("img")]
-            groupImages = [ImageReader(BytesIO(t)) for t in groupImageRawData if t != BLACK_GRP_IMAGE]
+            groupImageURLs = [userPhotos[t] for t in userPhotos if t.startswith("img")]
+            groupImages = [self.get_image(t, GROUP_SIZE) for t in groupImageURLs if self.get_image_bytes(t) != BLACK_GRP_IMAGE]
             if len(groupImages) > 0:
                 c.setFillColor(self.accent_color)
                 c.setFont("Helvetica-Bold", 15)
@@ -334,16 +982,13 @@ class YearBook:
                 c.drawString(155, 495, "Smiles That Speak of Shared Journeys and Lasting Bonds")
                 groupPhotosInserted = True
             for i in range(len(groupImages)):
-                c.drawImage(groupImages[i], 50 + (i % 2) * 265, 310 - (i // 2) * 200, (width - 110)/2, (width - 110)/2 * (2/3)) # 3:2 aspect ratio
+                c.drawImage(groupImages[i], 50 + (i % 2) * 265, 310 - (i // 2) * 200, *GROUP_SIZE)
             imagesInserted = coverPhotoInserted or groupPhotosInserted
-        except:
-            time.sleep(0)
+        except Exception as e:
+            print(f"Warning: Could not add your cover and group photos: {str(e)}")
 
         if imagesInserted:
-            c.showPage()
-            if self.dark_mode:
-                c.setFillColor(self.bg_color)
-                c.rect(0, 0, width, height, fill=1)
+            self._new_page(c)
             c.setFont("Helvetica-Bold", 20)
             c.setFillColor(self.accent_color)
             c.drawString(175, 750, "What people wrote for you")
@@ -354,116 +999,206 @@ class YearBook:
             c.drawString(175, 690, "What people wrote for you")
             y_position = 670
 
-        # Calculate total messages for progress bar
-        total_messages = len(self.messagesForYou) + len(self.messagesByYou)
-        if self.include_friends:
-            for friend_data in self.friendMessages:
-                total_messages += len(friend_data['messages_by']) + len(friend_data['messages_for'])
-        
-        progressBar = tqdm(total=total_messages)
-
         # Your messages
-        for message in self.messagesForYou:
-            if y_position < 150: 
-                c.showPage()
-                if self.dark_mode:
-                    c.setFillColor(self.bg_color)
-                    c.rect(0, 0, width, height, fill=1)
-                y_position = 750
-            y_position = self.add_message_block(c, message, y_position)
-            progressBar.update(1)
-            self.progress += 1
-            if self.progress_callback:
-                self.progress_callback(self.progress)
-        
+        self._draw_messages(c, self.messagesForYou, y_position)
+
+    def layout_messages(self, messages, y_position):
+        """Wrap every message and plan the blocks onto pages without drawing anything, see ``iter_layout``.
+
+        Args:
+            messages (list): Messages of one section
+            y_position (float): Top of the first block on the current page
+
+        Returns:
+            tuple: The wrapped lines of every message and the ``Placement`` list from ``plan_blocks``
+        """
+        width, height = letter
+        with self.metrics.timer("layout"):
+            layouts = [wrap_text(message.content, width - 120).lines for message in messages]
+            return layouts, plan_blocks([len(lines) for lines in layouts], y_position, header_height=HEADER_HEIGHT)
+
+    def iter_layout(self, messages, y_position):
+        """Wrap and place messages one at a time, as they are drawn.
+
+        Args:
+            messages (iterable): Messages of one section, consumed lazily
+            y_position (float): Top of the first block on the current page
+
+        Yields:
+            tuple: ``(message, wrapped lines, Placement)`` for every part of every block in drawing order
+        """
+        width, height = letter
+        # iter_blocks places every part of a block before asking for the next line count
+        current = [None, None]
+
+        def line_counts():
+            for message in messages:
+                with self.metrics.timer("layout"):
+                    current[0] = message
+                    current[1] = wrap_text(message.content, width - 120).lines
+                yield len(current[1])
+
+        for placement in iter_blocks(line_counts(), y_position, header_height=HEADER_HEIGHT):
+            yield current[0], current[1], placement
+
+    def _draw_messages(self, c, messages, y_position):
+        """Draw the messages of a section page by page, each wrapped just before it is placed."""
+        page = 0
+        for message, lines, placement in self.iter_layout(messages, y_position):
+            while page < placement.page:
+                self._new_page(c)
+                page += 1
+            self.add_message_block(c, message, placement.y, lines[placement.start:placement.end], placement.header)
+            if placement.end == len(lines):
+                self._advance(1)
+
+    def _advance(self, count):
+        """Report ``count`` more message blocks as rendered."""
+        if getattr(self, 'progress_bar', None) is not None:
+            self.progress_bar.update(count)
+        self.progress += count
+        if self.progress_callback:
+            self.progress_callback(self.progress)
+        self._emit("render", self.progress, self.total_messages(), pages=self.pages_rendered)
+
+    def _new_page(self, c):
         c.showPage()
+        self.pages_rendered += 1
+        self._paint_background(c)
+
+    def _paint_background(self, c):
+        # Add dark background if in dark mode
         if self.dark_mode:
+            width, height = letter
             c.setFillColor(self.bg_color)
             c.rect(0, 0, width, height, fill=1)
-        c.setFont("Helvetica-Bold", 20)
-        c.setFillColor(self.accent_color)
-        c.drawString(175, 750, "What you wrote for others")
-        y_position = 720
-        
-        for message in self.messagesByYou:
-            if y_position < 150: 
-                c.showPage()
-                if self.dark_mode:
-                    c.setFillColor(self.bg_color)
-                    c.rect(0, 0, width, height, fill=1)
-                y_position = 750
-            y_position = self.add_message_block(c, message, y_position)
-            progressBar.update(1)
-            self.progress += 1
-            if self.progress_callback:
-                self.progress_callback(self.progress)
-
-        # Friends' messages (only if include_friends is True)
-        if self.include_friends:
-            for friend_data in self.friendMessages:
-                if not friend_data['messages_by'] and not friend_data['messages_for'] : continue
-                # Add friend introduction page
-                self.add_friend_intro_page(c, friend_data)
-                
-                # Messages written by the friend
-                if friend_data['messages_by']:
-                    c.showPage()
-                    if self.dark_mode:
-                        c.setFillColor(self.bg_color)
-                        c.rect(0, 0, width, height, fill=1)
-                    c.setFont("Helvetica-Bold", 16)
-                    c.setFillColor(self.accent_color)
-                    c.drawString(175, 750, f"Messages written by {friend_data['friend_name']}")
-                    y_position = 720
-
-                    for message in friend_data['messages_by']:
-                        if y_position < 150:
-                            c.showPage()
-                            if self.dark_mode:
-                                c.setFillColor(self.bg_color)
-                                c.rect(0, 0, width, height, fill=1)
-                            y_position = 750
-                        y_position = self.add_message_block(c, message, y_position)
-                        progressBar.update(1)
-                        self.progress += 1
-                        if self.progress_callback:
-                            self.progress_callback(self.progress)
-
-                # Messages written for the friend
-                if friend_data['messages_for']:
-                    c.showPage()
-                    if self.dark_mode:
-                        c.setFillColor(self.bg_color)
-                        c.rect(0, 0, width, height, fill=1)
-                    c.setFont("Helvetica-Bold", 16)
-                    c.setFillColor(self.accent_color)
-                    c.drawString(175, 750, f"Messages written for {friend_data['friend_name']}")
-                    y_position = 720
-
-                    for message in friend_data['messages_for']:
-                        if y_position < 150:
-                            c.showPage()
-                            if self.dark_mode:
-                                c.setFillColor(self.bg_color)
-                                c.rect(0, 0, width, height, fill=1)
-                            y_position = 750
-                        y_position = self.add_message_block(c, message, y_position)
-                        progressBar.update(1)
-                        self.progress += 1
-                        if self.progress_callback:
-                            self.progress_callback(self.progress)
-
-        c.save()
+
+def pool_size(workers, background_friends=False):
+    """Keep-alive connections a yearbook's transport needs to never drop one.
+
+    A background crawl runs its ``workers`` threads while the image prefetcher
+    runs as many again, plus the thread rendering the book.
+    """
+    return 2 * workers + 1 if background_friends else workers
+
+def _header_key(side, message):
+    """Everything one side of a message header shows, equal keys draw identical halves."""
+    if side == 'by':
+        return (side, message.written_by_user, message.written_by, message.written_by_dept, message.written_by_year,
+                message.written_by_image)
+    return (side, message.written_for_user, message.written_for, message.written_for_dept, message.written_for_year,
+            message.written_for_image)
+
+def _department_lines(dept, year, marker):
+    """Department and year as header lines, a long department is split at '&' or at ``marker``."""
+    if '&' in dept:
+        p = dept.split('&')
+        return [p[0], '&' + p[1], str(year)]
+    if marker in dept:
+        p = dept.split('and')
+        return [p[0], 'and' + p[1], str(year)]
+    return [dept, str(year)]
+
+# the image cache and transport of a worker process, shared by every section it renders
+_worker = {}
+
+def _init_worker(source):
+    """Open the image cache and transport of a worker process, see ``YearBook._worker_source``."""
+    if source['snapshot']:
+        _worker['image_cache'] = ImageCache(cache_dir=None)
+        _worker['transport'] = Snapshot(source['snapshot'])
+    else:
+        _worker['image_cache'] = ImageCache(source['cache_dir'])
+        _worker['transport'] = Transport(base_url=source['base_url'], pool_size=2)
+        if source['authorization']:
+            _worker['transport'].session.headers["Authorization"] = source['authorization']
+    # pool workers exit without running atexit handlers, multiprocessing's finalizers do run
+    multiprocessing.util.Finalize(None, _worker['transport'].close, exitpriority=0)
+
+def _render_fragment(state, output_file):
+    """Render one section to its own PDF in a worker process, see ``YearBook.generate_pdf``.
+
+    Returns:
+        tuple: Number of pages rendered and of images loaded, for the parent's progress and report
+    """
+    yb = YearBook.__new__(YearBook)
+    yb._configure(True, state['dark_mode'], _worker['image_cache'], 2, 32, state['image_dpi'], state['image_quality'])
+    yb.transport = _worker['transport']
+    yb.api = yb.transport
+    yb.sync_report = None
+    yb.userPhotos = state['userPhotos']
+    yb.messagesForYou = state['messagesForYou']
+    yb.messagesByYou = state['messagesByYou']
+    yb.friendMessages = state['friendMessages']
+    yb.font_subsets = yb.assets.font_subsets(state['characters'])
+    yb._generate_serial(output_file, [state['section']])
+    # the next section of this worker starts from a clean slate, like the one streaming in the parent does
+    yb._release_images([state['section']])
+    return yb.pages_rendered, yb.images_loaded
 
 if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="generate your yearbook")
-    parser.add_argument("username", help="yearbook website username of the form <username>@iitb.ac.in")
-    parser.add_argument("password", help="yearbook website password")
+    parser.add_argument("username", nargs="?", help="yearbook website username of the form <username>@iitb.ac.in")
+    parser.add_argument("password", nargs="?", help="yearbook website password")
     parser.add_argument("-f", "--friends", action="store_true", help="include friends' yearbooks as well")
     parser.add_argument("-d", "--dark", action="store_true", help="use dark mode color scheme")
+    parser.add_argument("--depth", type=int, default=1, help="with --friends, hops of the friend graph to include, 2 adds your friends' friends")
+    parser.add_argument("--max-friends", type=int, help="with --friends, largest number of friends to include")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="number of concurrent requests used to fetch friends' messages")
+    parser.add_argument("--lookahead", type=int, default=32, help="number of images downloaded ahead of the PDF renderer")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory used to cache downloaded images between runs")
+    parser.add_argument("-i", "--incremental", action="store_true", help="remember responses in the cache directory and only re-fetch what changed")
+    parser.add_argument("--sync-max-age", type=float, default=0, help="with --incremental, seconds a remembered response is reused without asking the website again")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of processes rendering sections of the PDF in parallel")
+    parser.add_argument("-s", "--stream", action="store_true", help="write finished sections to disk as they are rendered to keep memory use flat")
+    parser.add_argument("--image-dpi", type=float, default=DEFAULT_DPI, help="resolution pictures are downscaled to, lower makes a smaller PDF, 0 keeps the originals")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_QUALITY, help="JPEG quality (1-95) of downscaled pictures")
+    parser.add_argument("-o", "--output", default="yearbook.pdf", help="path of the generated PDF")
+    parser.add_argument("--save-snapshot", metavar="FILE", help="save everything fetched to a snapshot archive for offline rendering")
+    parser.add_argument("--fetch-only", action="store_true", help="only fetch (use with --save-snapshot), do not generate the PDF")
+    parser.add_argument("--snapshot", metavar="FILE", help="generate the PDF from a snapshot archive instead of the website")
+    parser.add_argument("--work-dir", metavar="DIR", help="save every crawled friend and rendered section to this directory so an interrupted run can be resumed")
+    parser.add_argument("--resume", action="store_true", help="with --work-dir, continue the run saved there instead of starting over")
+    parser.add_argument("--report", metavar="FILE", help="write a JSON report of where time went (phases, requests) to this file")
+    parser.add_argument("--profile", choices=Profiler.MODES, help="add a cProfile (cpu) or tracemalloc (memory) profile to the report")
 
     args = parser.parse_args()
+    if args.resume and not args.work_dir:
+        parser.error("--resume needs the --work-dir of the run to continue")
+
+    checkpoint = None
+    if args.work_dir and (args.snapshot or args.username):
+        # everything saved in the work directory depends on the account and on which friends are crawled
+        account = os.path.abspath(args.snapshot) if args.snapshot else args.username
+        options = {"include_friends": args.friends, "friend_depth": args.depth, "max_friends": args.max_friends}
+        try:
+            checkpoint = Checkpoint(args.work_dir, account, options, resume=args.resume)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.snapshot:
+        yb = YearBook.from_snapshot(args.snapshot, include_friends=args.friends or None, dark_mode=args.dark, workers=args.workers, lookahead=args.lookahead,
+                                    image_dpi=args.image_dpi or None, image_quality=args.image_quality, profile=args.profile)
+        yb.checkpoint = checkpoint
+    elif args.username and args.password:
+        sync_store = SyncStore(os.path.join(args.cache_dir, "sync.sqlite")) if args.incremental else None
+        yb = YearBook(args.username, args.password, args.friends, args.dark, image_cache=ImageCache(args.cache_dir), workers=args.workers,
+                      lookahead=args.lookahead, sync_store=sync_store, sync_max_age=args.sync_max_age,
+                      image_dpi=args.image_dpi or None, image_quality=args.image_quality, friend_depth=args.depth, max_friends=args.max_friends,
+                      profile=args.profile, checkpoint=checkpoint, background_friends=args.stream and not args.fetch_only)
+        if args.save_snapshot:
+            yb.save_snapshot(args.save_snapshot)
+    else:
+        parser.error("username and password are required unless --snapshot is given")
+
+    if not args.fetch_only:
+        yb.generate_pdf(args.output, processes=args.processes, stream=args.stream)
+
+    # printed once the book is rendered: with --stream, friends are crawled while it is
+    if yb.sync_report is not None:
+        print(yb.sync_report.summary())
 
-    yb = YearBook(args.username, args.password, args.friends, args.dark)
-    yb.generate_pdf("yearbook.pdf")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(yb.report(), f, indent=2)
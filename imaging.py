@@ -0,0 +1,79 @@
+from io import BytesIO
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+import math
+
+DEFAULT_DPI = 150
+DEFAULT_QUALITY = 80
+
+class SharedImageReader(ImageReader):
+    """``ImageReader`` that can be drawn by several canvases and threads at once.
+
+    The pixels are decoded up front, since pillow loads lazily and is not safe
+    to load from two threads, and only reportlab's RGB copy of them is kept. For JPEGs reportlab copies the compressed data
+    straight into the PDF; it reads it from the reader's file handle, so every
+    read gets a private handle instead of seeking a shared one.
+    """
+
+    def __init__(self, data):
+        """Wrap and decode an encoded image.
+
+        Args:
+            data (bytes): Encoded image
+        """
+        super().__init__(BytesIO(data))
+        self._encoded = data
+        self.getSize()
+        # memory held by the reader, the encoded and the decoded image
+        self.nbytes = len(data) + len(self.getRGBData())
+        # drawing only needs the size, the RGB data and the encoded image from here on, so free
+        # pillow's copy of the pixels and the private copy of the file; info and palette stay readable
+        self._image.close()
+        self.fp = None
+
+    def _jpeg_fh(self):
+        return BytesIO(self._encoded)
+
+def target_pixels(size, dpi):
+    """Pixel size needed to draw an image ``size`` points large at ``dpi``.
+
+    Args:
+        size (tuple): Width and height of the placement in points
+        dpi (float): Resolution the image should have on paper
+
+    Returns:
+        tuple: Width and height in pixels
+    """
+    width, height = size
+    return max(1, math.ceil(width * dpi / 72)), max(1, math.ceil(height * dpi / 72))
+
+def downscale(data, pixels, quality=DEFAULT_QUALITY):
+    """Resample an image to at most ``pixels`` and recompress it.
+
+    The image is stretched to the placement box the same way ``drawImage``
+    would stretch it, but never enlarged: images that already fit are
+    returned untouched. Opaque images are written as JPEG, which reportlab
+    embeds without re-encoding; images with transparency stay PNG.
+
+    Args:
+        data (bytes): Encoded source image
+        pixels (tuple): Largest width and height in pixels, see ``target_pixels``
+        quality (int): JPEG quality, 1 to 95
+
+    Returns:
+        bytes: The encoded image, ``data`` itself when nothing had to be done
+    """
+    with Image.open(BytesIO(data)) as image:
+        width, height = min(image.width, pixels[0]), min(image.height, pixels[1])
+        if (width, height) == image.size:
+            return data
+        image.draft("RGB", (width, height))  # lets JPEG decode at a reduced scale
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB").resize((width, height), Image.LANCZOS)
+
+    out = BytesIO()
+    if has_alpha:
+        image.save(out, "PNG", optimize=True)
+    else:
+        image.save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue()
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor
+from cache import ImageCache
+from events import ProgressTracker
+from metrics import Metrics, peak_rss_bytes
+from generateYearBook import YearBook, pool_size
+from transport import Transport
+import os
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+FETCHING = "fetching"
+RENDERING = "rendering"
+DONE = "done"
+FAILED = "failed"
+
+class QueueFull(Exception):
+    """Raised when too many jobs are waiting to be run."""
+
+class Job:
+    """One yearbook generation request and its state."""
+
+    def __init__(self, email, password, options, output_dir, output_path=None):
+        self.id = uuid.uuid4().hex
+        self.email = email
+        self.password = password
+        self.options = options
+        self.output_path = output_path or os.path.join(output_dir, f"{self.id}.pdf")
+        self.state = QUEUED
+        self.progress = 0
+        self.error = None
+        phases = ("fetch", "friends", "images", "render") if options.get("include_friends") else ("fetch", "images", "render")
+        self.tracker = ProgressTracker(phases)
+        self.report = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def wait(self, timeout=None):
+        """Block until the job is done or failed, returns False if ``timeout`` seconds passed first."""
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        return {"id": self.id, "state": self.state, "progress": self.progress, "error": self.error}
+
+class JobManager:
+    """Runs yearbook jobs on a bounded worker pool.
+
+    Every job gets its own ID and output file, so concurrent users never see
+    each other's progress or PDF. At most ``workers`` jobs run at once and at
+    most ``max_pending`` wait for a worker; finished jobs and their files are
+    removed ``ttl`` seconds after they finish. All jobs share one image cache,
+    since classmates' yearbooks show many of the same faces. The reports of
+    finished jobs add up in ``metrics``, see ``prometheus``.
+    """
+
+    def __init__(self, output_dir="output", workers=4, max_pending=500, ttl=3600, image_cache=None, profile=None):
+        """Initialize the manager and start the cleanup thread.
+
+        Args:
+            output_dir (str): Directory the generated PDFs are written to
+            workers (int): Number of jobs run concurrently
+            max_pending (int): Number of jobs allowed to wait for a worker
+            ttl (float): Seconds a finished job and its PDF are kept
+            image_cache (ImageCache): Image cache shared by all jobs, a default on-disk one is used if None
+            profile (str): ``cpu`` or ``memory`` to attach a profile to every job's report
+        """
+        self.output_dir = output_dir
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.image_cache = image_cache if image_cache is not None else ImageCache()
+        self.profile = profile
+        self.metrics = Metrics()
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yearbook-job")
+        os.makedirs(output_dir, exist_ok=True)
+        threading.Thread(target=self._reap, daemon=True).start()
+
+    def submit(self, email, password, output_path=None, **options):
+        """Queue a new job.
+
+        Args:
+            email (str): Username for authentication
+            password (str): Password for authentication
+            output_path (str): Path of the PDF, ``<job ID>.pdf`` in the output directory if None
+            **options: Passed on to ``YearBook``, e.g. ``include_friends`` and ``dark_mode``; a ``transport`` is closed when the job finishes
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFull: If ``max_pending`` jobs are already waiting
+        """
+        job = Job(email, password, options, self.output_dir, output_path)
+        with self._lock:
+            pending = sum(1 for j in self.jobs.values() if j.state == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFull("Too many yearbooks are being generated right now, please try again later.")
+            self.jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """Return the job with ``job_id``, or None if it does not exist or has expired."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cleanup(self):
+        """Forget jobs that finished more than ``ttl`` seconds ago and delete their PDFs."""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self.jobs.values() if job.finished and now - job.finished_at > self.ttl]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            try:
+                os.remove(job.output_path)
+            except OSError:
+                pass
+
+    def prometheus(self):
+        """Totals over every finished job plus the current queue, in the Prometheus text format."""
+        with self._lock:
+            states = [job.state for job in self.jobs.values()]
+        lines = ["# TYPE yearbook_jobs gauge"]
+        lines += [f'yearbook_jobs{{state="{state}"}} {states.count(state)}' for state in (QUEUED, FETCHING, RENDERING, DONE, FAILED)]
+        lines += ["# TYPE yearbook_image_cache_lookups_total counter"]
+        lines += [f'yearbook_image_cache_lookups_total{{result="{result}"}} {count}' for result, count in
+                  (("hit", self.image_cache.hits), ("disk_hit", self.image_cache.disk_hits), ("miss", self.image_cache.misses))]
+        peak = peak_rss_bytes()
+        if peak is not None:
+            lines += ["# TYPE yearbook_process_peak_rss_bytes gauge", f"yearbook_process_peak_rss_bytes {peak}"]
+        return self.metrics.to_prometheus() + "\n".join(lines) + "\n"
+
+    def _collect(self, job, report):
+        job.report = report
+        self.metrics.merge(report)
+        for endpoint, counters in report["network"].items():
+            for key in ("requests", "failures", "retries", "bytes", "seconds"):
+                self.metrics.count(f"http_{key}", counters[key], endpoint=endpoint)
+        self.metrics.count("pages", report["pages"])
+        self.metrics.count("messages", report["messages"])
+
+    def _run(self, job):
+        yb = None
+        job.started_at = time.time()
+        # the job owns its transport, whether it was passed in or not, and closes it even if YearBook fails to log in
+        options = dict({"background_friends": True}, **job.options)
+        transport = options.get("transport") or Transport(pool_size=pool_size(options.get("workers", 8), options["background_friends"]))
+        options["transport"] = transport
+        try:
+            job.state = FETCHING
+            # friends are crawled while the first sections render, see generate_pdf
+            yb = YearBook(job.email, job.password, image_cache=self.image_cache, event_callback=self._track(job),
+                          profile=self.profile, **options)
+            # credentials are not needed any more
+            job.password = None
+
+            job.state = RENDERING
+            # stream finished sections to disk so large friend books do not pile up in memory
+            yb.generate_pdf(job.output_path, stream=True)
+            job.progress = 100
+            job.state = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.password = None
+            job.finished_at = time.time()
+            self.metrics.count("jobs", state=job.state)
+            if yb is not None:
+                self._collect(job, yb.report())
+            transport.close()
+            job.tracker.finish()
+            job._finished.set()
+
+    def _track(self, job):
+        def on_event(phase, done, total, **extra):
+            job.tracker(phase, done, total, **extra)
+            job.progress = job.tracker.percent()
+        return on_event
+
+    def _reap(self):
+        while True:
+            time.sleep(min(60, self.ttl))
+            self.cleanup()
@@ -0,0 +1,177 @@
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from reportlab.pdfbase import pdfmetrics
+
+# distinct words whose widths are remembered per font and size, see GlyphWidths
+WORD_CACHE_SIZE = 16384
+
+class GlyphWidths:
+    """Memoized advance widths for one font at one size.
+
+    Character widths are looked up once and word widths are summed from them,
+    so wrapping never asks reportlab to measure the same text twice. The
+    tables are shared by every yearbook of a long-running process, so only
+    the ``WORD_CACHE_SIZE`` most recently used words are remembered; there
+    are only as many characters as the font has glyphs.
+    """
+
+    def __init__(self, font_name, font_size):
+        self.font_name = font_name
+        self.font_size = font_size
+        self._chars = {}
+        self.word = lru_cache(maxsize=WORD_CACHE_SIZE)(self._word)
+        self.space = self.char(" ")
+
+    def char(self, ch):
+        width = self._chars.get(ch)
+        if width is None:
+            width = self._chars[ch] = pdfmetrics.stringWidth(ch, self.font_name, self.font_size)
+        return width
+
+    def _word(self, word):
+        return sum(self.char(ch) for ch in word)
+
+@lru_cache(maxsize=None)
+def glyph_widths(font_name, font_size):
+    """Shared ``GlyphWidths`` table for a registered font."""
+    return GlyphWidths(font_name, font_size)
+
+class TextLayout:
+    """Result of wrapping a piece of text: its lines and their total height."""
+
+    __slots__ = ("lines", "leading")
+
+    def __init__(self, lines, leading):
+        self.lines = lines
+        self.leading = leading
+
+    @property
+    def height(self):
+        return len(self.lines) * self.leading
+
+@lru_cache(maxsize=4096)
+def wrap_text(text, max_width, font_name="Symbola", font_size=12, leading=12):
+    """Break ``text`` into lines no wider than ``max_width``.
+
+    Every paragraph is wrapped greedily: the widths of ``word + " "`` are
+    turned into prefix sums once, and the end of each line is found by
+    bisecting them, so a paragraph is laid out in a single pass over its
+    words. Blank paragraphs produce no lines, and a word wider than a whole
+    line gets a line of its own. Results are memoized, so a message shown in
+    several sections is only laid out once.
+
+    Args:
+        text (str): Text to wrap, paragraphs separated by newlines
+        max_width (float): Available width in points
+        font_name (str): Registered font the text is drawn in
+        font_size (float): Font size in points
+        leading (float): Distance between baselines in points
+
+    Returns:
+        TextLayout: The wrapped lines, ``height`` is known before anything is drawn
+    """
+    widths = glyph_widths(font_name, font_size)
+    lines = []
+    for paragraph in text.splitlines():
+        words = paragraph.split()
+        if not words:
+            continue
+        # offsets[i] is the width of words[:i], each followed by a space
+        offsets = [0.0]
+        offsets.extend(accumulate(widths.word(word) + widths.space for word in words))
+        start = 0
+        while start < len(words):
+            end = bisect_right(offsets, offsets[start] + max_width) - 1
+            end = max(end, start + 1)
+            lines.append(" ".join(words[start:end]))
+            start = end
+    return TextLayout(lines, leading)
+
+class Placement:
+    """Where one message block, or the part of it on one page, is drawn.
+
+    ``y`` is the top of the block when ``header`` is True (the separator line
+    sits there and the text starts ``header_height`` below it), otherwise it
+    is the baseline of the first continued line.
+    """
+
+    __slots__ = ("index", "page", "y", "start", "end", "header")
+
+    def __init__(self, index, page, y, start, end, header):
+        self.index = index
+        self.page = page
+        self.y = y
+        self.start = start
+        self.end = end
+        self.header = header
+
+def lines_fitting(top, bottom, leading):
+    """Number of baselines that fit between ``top`` and ``bottom``, both inclusive."""
+    if top < bottom:
+        return 0
+    return int((top - bottom) // leading) + 1
+
+def plan_blocks(line_counts, top, **options):
+    """Assign message blocks to pages before anything is drawn, see ``iter_blocks``.
+
+    Returns:
+        list: ``Placement`` objects in drawing order, ``page`` counts pages after the current one
+    """
+    return list(iter_blocks(line_counts, top, **options))
+
+def iter_blocks(line_counts, top, page_top=750, continuation_top=742, bottom=50,
+                header_height=85, leading=12, gap=50, min_lines=3):
+    """Assign message blocks to pages as their line counts come in.
+
+    Blocks are kept in order and packed greedily, which gives the fewest pages
+    for a fixed order. A block that does not fit in the space left on a page
+    is split rather than pushed to the next page, unless that would leave
+    fewer than ``min_lines`` lines with its header or on the following page.
+    In that case it starts on a fresh page, so a header is never orphaned at
+    the bottom of a page. This holds for the first block too when ``top`` is
+    below ``page_top``, since a new page has more room. Every placement of a
+    block is yielded before the line count of the next one is read, so blocks
+    can be wrapped lazily and drawn as soon as they are placed.
+
+    Args:
+        line_counts (iterable): Number of wrapped content lines of every block
+        top (float): Top of the first block on the current page
+        page_top (float): Top of the first block on a new page
+        continuation_top (float): Baseline of the first line of a block continued on a new page
+        bottom (float): Lowest allowed baseline
+        header_height (float): Distance from the top of a block to its first baseline
+        leading (float): Distance between baselines
+        gap (float): Space between the last line of a block and the top of the next one
+        min_lines (int): Fewest lines kept together when a block is split
+
+    Yields:
+        Placement: Placements in drawing order, ``page`` counts pages after the current one
+    """
+    page, y = 0, top
+
+    for index, count in enumerate(line_counts):
+        header_fits = y - header_height >= bottom
+        room = lines_fitting(y - header_height, bottom, leading) if header_fits else 0
+        take = count if header_fits and count <= room else min(room, count - min_lines)
+        if y < page_top and (not header_fits or (take < count and take < min_lines)):
+            # too little room for the header and a decent first part, a new page has more
+            page, y = page + 1, page_top
+            room = lines_fitting(y - header_height, bottom, leading)
+            take = count if count <= room else min(room, count - min_lines)
+        take = max(take, min(count, 1))
+
+        yield Placement(index, page, y, 0, take, True)
+        y -= header_height + leading * take + gap
+
+        done = take
+        while done < count:
+            page += 1
+            remaining = count - done
+            take = min(lines_fitting(continuation_top, bottom, leading), remaining)
+            if 0 < remaining - take < min_lines:
+                # leave enough lines for the next page
+                take = remaining - min_lines
+            yield Placement(index, page, continuation_top, done, done + take, False)
+            y = continuation_top - leading * take - gap
+            done += take
@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# cProfile allows one active profiler per process, held by the job being profiled while concurrent ones skip it
+_cpu_profiling = threading.Lock()
+
+def peak_rss_bytes(children=False):
+    """Peak resident set size of this process in bytes, None where the platform does not report it.
+
+    Args:
+        children (bool): Report the larger of this process and its largest finished child process
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak * (1 if sys.platform == "darwin" else 1024)
+
+class Metrics:
+    """Thread-safe timers and counters for the phases of a yearbook run.
+
+    Timers accumulate calls, total and longest duration per phase; counters
+    add up values per name and label set. ``report`` returns everything as a
+    JSON-serializable dict, ``merge`` adds such a report to another instance
+    (e.g. the totals over every job of the web app) and ``to_prometheus``
+    renders the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.timers = {}    # phase -> [calls, seconds, max seconds]
+        self.counters = {}  # (name, ((label, value), ...)) -> value
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, phase):
+        """Time the body of the ``with`` block as one call of ``phase``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - started)
+
+    def observe(self, phase, seconds, calls=1, max_seconds=None):
+        """Record ``calls`` calls of ``phase`` that took ``seconds`` in total."""
+        with self._lock:
+            timer = self.timers.setdefault(phase, [0, 0.0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds if max_seconds is None else max_seconds)
+
+    def count(self, name, value=1, **labels):
+        """Add ``value`` to the counter ``name`` with ``labels``."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self):
+        """Timers and counters as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "phases": {phase: {"calls": calls, "seconds": round(seconds, 6), "max_seconds": round(longest, 6)}
+                           for phase, (calls, seconds, longest) in self.timers.items()},
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self.counters.items()],
+            }
+
+    def merge(self, report):
+        """Add the timers and counters of a ``report`` to these."""
+        for phase, timer in report.get("phases", {}).items():
+            self.observe(phase, timer["seconds"], timer["calls"], timer["max_seconds"])
+        for counter in report.get("counters", []):
+            self.count(counter["name"], counter["value"], **counter["labels"])
+
+    def to_prometheus(self, prefix="yearbook"):
+        """Render the metrics in the Prometheus text exposition format.
+
+        Timers become ``<prefix>_phase_seconds`` summaries (``_sum`` and
+        ``_count``) plus a ``<prefix>_phase_seconds_max`` gauge, counters
+        become ``<prefix>_<name>_total``.
+        """
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        if timers:
+            lines.append(f"# TYPE {prefix}_phase_seconds summary")
+            for phase, (calls, seconds, _) in timers:
+                lines.append(f"{prefix}_phase_seconds_sum{_labels({'phase': phase})} {seconds:.6f}")
+                lines.append(f"{prefix}_phase_seconds_count{_labels({'phase': phase})} {calls}")
+            lines.append(f"# TYPE {prefix}_phase_seconds_max gauge")
+            for phase, (_, _, longest) in timers:
+                lines.append(f"{prefix}_phase_seconds_max{_labels({'phase': phase})} {longest:.6f}")
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                typed.add(name)
+            lines.append(f"{prefix}_{name}_total{_labels(dict(labels))} {value}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+class Profiler:
+    """Optional cProfile or tracemalloc session around the expensive parts of a run.
+
+    ``cpu`` profiles the thread that enters ``running``, i.e. the fetch and
+    render loops but not the download threads. Only one cpu session can be
+    active per process; a session that finds another one running is skipped
+    with a note and counted in ``skipped``, it never fails the job. ``memory``
+    traces allocations process-wide, so concurrent jobs show up in each
+    other's numbers.
+    """
+
+    MODES = ("cpu", "memory")
+
+    def __init__(self, mode):
+        """Initialize the profiler.
+
+        Args:
+            mode (str): ``cpu`` for cProfile or ``memory`` for tracemalloc
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {', '.join(self.MODES)}")
+        self.mode = mode
+        self.peak_bytes = 0
+        self.skipped = 0
+        self._profiled = False
+        self._profile = cProfile.Profile() if mode == "cpu" else None
+        self._snapshot = None
+
+    @contextmanager
+    def running(self):
+        """Profile the body of the ``with`` block, sessions add up."""
+        if self.mode == "cpu":
+            enabled = _cpu_profiling.acquire(blocking=False)
+            if enabled:
+                try:
+                    self._profile.enable()
+                except ValueError as e:
+                    # another profiling tool, e.g. a debugger, holds the interpreter's profiler
+                    _cpu_profiling.release()
+                    enabled = False
+                    print(f"Note: CPU profiling skipped: {str(e)}")
+            else:
+                print("Note: CPU profiling skipped, another job is being profiled")
+            if not enabled:
+                self.skipped += 1
+                yield
+                return
+            self._profiled = True
+            try:
+                yield
+            finally:
+                self._profile.disable()
+                _cpu_profiling.release()
+            return
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            self._snapshot = tracemalloc.take_snapshot()
+            if started:
+                tracemalloc.stop()
+
+    def report(self, limit=20):
+        """The ``limit`` most expensive functions or allocation sites as a JSON-serializable dict."""
+        if self.mode == "cpu":
+            rows = []
+            if self._profiled:
+                stats = pstats.Stats(self._profile, stream=io.StringIO())
+                rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+            return {"mode": "cpu", "skipped_sessions": self.skipped, "top": [
+                {"function": f"{filename}:{line}({name})", "calls": calls, "own_seconds": round(own, 6),
+                 "cumulative_seconds": round(cumulative, 6)}
+                for (filename, line, name), (_, calls, own, cumulative, _) in rows
+            ]}
+
+        top = self._snapshot.statistics("lineno")[:limit] if self._snapshot is not None else []
+        return {"mode": "memory", "peak_bytes": self.peak_bytes, "top": [
+            {"site": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count} for stat in top
+        ]}
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
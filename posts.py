@@ -0,0 +1,176 @@
+from sync import post_id
+import sys
+import threading
+
+class Message:
+    """Compact record of one post, holding only what the yearbook draws.
+
+    The portal sends every post as a dict with two nested profile dicts. A
+    record keeps the same fields in slots, and the department, year, name and
+    picture strings, which repeat across thousands of posts, are interned so
+    every distinct value is held once.
+    """
+
+    __slots__ = ("id", "content", "written_by", "written_for", "written_by_dept", "written_by_year", "written_for_dept",
+                 "written_for_year", "written_by_user", "written_for_user", "written_by_name", "written_for_name",
+                 "written_by_image", "written_for_image")
+
+    def __init__(self, id, content, written_by, written_for, written_by_dept, written_by_year, written_for_dept,
+                 written_for_year, written_by_user, written_for_user, written_by_name, written_for_name,
+                 written_by_image, written_for_image):
+        self.id = id
+        self.content = content
+        self.written_by = written_by
+        self.written_for = written_for
+        self.written_by_dept = written_by_dept
+        self.written_by_year = written_by_year
+        self.written_for_dept = written_for_dept
+        self.written_for_year = written_for_year
+        self.written_by_user = written_by_user
+        self.written_for_user = written_for_user
+        self.written_by_name = written_by_name
+        self.written_for_name = written_for_name
+        self.written_by_image = written_by_image
+        self.written_for_image = written_for_image
+
+    @classmethod
+    def from_post(cls, post, key=None):
+        """Build a record from a post as the portal sends it.
+
+        Args:
+            post (dict): The post
+            key: ID to store the post under, taken from the post (or a digest of it) if None
+        """
+        by_profile = post.get('written_by_profile') or {}
+        for_profile = post.get('written_for_profile') or {}
+        return cls(
+            post_id(post) if key is None else key,
+            post.get('content') or "",
+            _intern(post.get('written_by')),
+            _intern(post.get('written_for')),
+            # anonymous users have no department and year, the portal sends "None"
+            _intern(post.get('written_by_dept'), "None"),
+            _intern(post.get('written_by_year'), "None"),
+            _intern(post.get('written_for_dept'), "None"),
+            _intern(post.get('written_for_year'), "None"),
+            by_profile.get('user'),
+            for_profile.get('user'),
+            _intern(by_profile.get('name')),
+            _intern(for_profile.get('name')),
+            _intern(by_profile.get('profile_image')),
+            _intern(for_profile.get('profile_image')),
+        )
+
+    def to_post(self):
+        """The post in the portal's format, e.g. for snapshots."""
+        return {
+            'id': self.id,
+            'content': self.content,
+            'written_by': self.written_by,
+            'written_for': self.written_for,
+            'written_by_dept': self.written_by_dept,
+            'written_by_year': self.written_by_year,
+            'written_for_dept': self.written_for_dept,
+            'written_for_year': self.written_for_year,
+            'written_by_profile': {'user': self.written_by_user, 'name': self.written_by_name, 'profile_image': self.written_by_image},
+            'written_for_profile': {'user': self.written_for_user, 'name': self.written_for_name, 'profile_image': self.written_for_image},
+        }
+
+class PostStore:
+    """Every post fetched from the portal, held once and indexed by person.
+
+    The portal only lists posts per person (``posts/my/<id>`` and
+    ``posts/others/<id>``), so a post between two friends arrives in both of
+    their lists, and in yours too if you wrote or received it. The store keeps
+    a single copy per post ID plus, for every person crawled, the IDs of the
+    posts they wrote and received in portal order. Message lists built from it
+    share the post objects, so memory grows with the number of unique posts.
+    A store may be shared by yearbooks built concurrently, see ``batch.py``.
+    """
+
+    def __init__(self):
+        self.posts = {}         # post ID -> post
+        self.by_author = {}     # user ID -> IDs of the posts they wrote
+        self.by_recipient = {}  # user ID -> IDs of the posts written for them
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.posts)
+
+    def add(self, posts):
+        """Store posts, keeping the copy seen first for IDs that are already known.
+
+        Args:
+            posts (iterable): ``Message`` records or posts as the portal sends them, converted as they are consumed
+
+        Returns:
+            list: The IDs of ``posts``, in order
+        """
+        messages = [post if isinstance(post, Message) else Message.from_post(post) for post in posts]
+        with self._lock:
+            for message in messages:
+                self.posts.setdefault(message.id, message)
+        return [message.id for message in messages]
+
+    def set_written_by(self, user_id, posts):
+        """Record the posts ``user_id`` wrote, as listed by ``posts/my/<user_id>``."""
+        self.by_author[user_id] = self.add(posts)
+
+    def set_written_for(self, user_id, posts):
+        """Record the posts written for ``user_id``, as listed by ``posts/others/<user_id>``."""
+        self.by_recipient[user_id] = self.add(posts)
+
+    def crawled(self, user_id):
+        """Whether both lists of ``user_id`` are already in the store."""
+        return user_id in self.by_author and user_id in self.by_recipient
+
+    def written_by(self, user_id):
+        """Posts ``user_id`` wrote, in portal order."""
+        return [self.posts[key] for key in self.by_author.get(user_id, ())]
+
+    def written_for(self, user_id):
+        """Posts written for ``user_id``, in portal order."""
+        return [self.posts[key] for key in self.by_recipient.get(user_id, ())]
+
+    def to_dict(self):
+        """JSON-serializable form, see ``from_dict``. Pairs keep integer IDs intact."""
+        with self._lock:
+            return {
+                "posts": [(key, message.to_post()) for key, message in self.posts.items()],
+                "by_author": list(self.by_author.items()),
+                "by_recipient": list(self.by_recipient.items()),
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        store.posts = {key: Message.from_post(post, key) for key, post in data["posts"]}
+        store.by_author = dict(data["by_author"])
+        store.by_recipient = dict(data["by_recipient"])
+        return store
+
+def correspondents(messages_for, messages_by):
+    """IDs of the people who wrote ``messages_for`` and received ``messages_by``, in first-seen order."""
+    # a dict keeps first-seen order, so friends come out in the same order on every run
+    user_ids = {}
+
+    # people who have written to them
+    for message in messages_for:
+        if message.written_by_user is not None:
+            user_ids[message.written_by_user] = None
+        else:
+            print(f"Warning: Could not get friend ID from message {message.id}, it has no author profile")
+
+    # people they have written to
+    for message in messages_by:
+        if message.written_for_user is not None:
+            user_ids[message.written_for_user] = None
+        else:
+            print(f"Warning: Could not get friend ID from message {message.id}, it has no recipient profile")
+
+    return list(user_ids)
+
+def _intern(value, default=None):
+    if value is None:
+        return default
+    return sys.intern(value) if isinstance(value, str) else value
@@ -0,0 +1,57 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class ImagePrefetcher:
+    """Resolve images on a background pool ahead of the renderer.
+
+    ``urls`` is the sequence of images in the order the renderer will ask for
+    them. At most ``lookahead`` of them are in flight or waiting to be drawn at
+    any time; every ``take`` hands over the oldest one and schedules the next,
+    so downloads overlap with layout while memory stays bounded by the window.
+    """
+
+    def __init__(self, resolve, urls, workers=4, lookahead=32):
+        """Initialize the prefetcher and start resolving the first window.
+
+        Args:
+            resolve (callable): Called with a URL on a worker thread, returns the image handle
+            urls (iterable): URLs in the order they will be taken
+            workers (int): Number of images resolved at once
+            lookahead (int): Maximum number of images resolved ahead of the renderer
+        """
+        self.resolve = resolve
+        self.lookahead = max(1, lookahead)
+        self._urls = iter(urls)
+        self._window = deque()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._fill()
+
+    def take(self, url):
+        """Return the resolved handle for ``url``.
+
+        Images the renderer skipped are dropped from the front of the window.
+        A URL that is not in the window at all is resolved on the calling thread.
+        """
+        for i, (queued_url, _) in enumerate(self._window):
+            if queued_url == url:
+                break
+        else:
+            return self.resolve(url)
+
+        for _ in range(i):
+            self._window.popleft()
+        _, future = self._window.popleft()
+        self._fill()
+        return future.result()
+
+    def close(self):
+        """Stop resolving images that have not been started yet."""
+        self._window.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _fill(self):
+        while len(self._window) < self.lookahead:
+            url = next(self._urls, None)
+            if url is None:
+                return
+            self._window.append((url, self._pool.submit(self.resolve, url)))
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import zipfile
+
+SNAPSHOT_VERSION = 2
+# version 1 held full message lists instead of the post store, it is still readable
+SUPPORTED_VERSIONS = (1, 2)
+
+class Snapshot:
+    """Read side of a yearbook snapshot archive.
+
+    A snapshot is a zip file holding ``manifest.json`` (the user, the post
+    store, gallery and friend data plus a map from image path to content digest) and
+    one ``blobs/<sha256>`` entry per distinct image. It stands in for the
+    ``Transport`` when rendering, so a PDF can be generated from it without
+    touching the network.
+    """
+
+    def __init__(self, path):
+        """Open a snapshot.
+
+        Args:
+            path (str): Path of the archive written by ``write_snapshot``
+        """
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self.manifest = json.loads(self._zip.read("manifest.json"))
+        if self.manifest.get("version") not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported snapshot version {self.manifest.get('version')} in {path}")
+        self.base_url = self.manifest["base_url"]
+        self._images = self.manifest["images"]
+
+    def url(self, path):
+        """Resolve an image path to the absolute URL it was fetched from."""
+        return path if path.startswith(("http://", "https://")) else self.base_url + path
+
+    def get_bytes(self, url):
+        """Return the stored bytes of an image, raising ``KeyError`` if it was not captured."""
+        digest = self._images.get(url)
+        if digest is None:
+            raise KeyError(f"Image {url} is not in snapshot {self.path}")
+        return self._zip.read(f"blobs/{digest}")
+
+    def close(self):
+        self._zip.close()
+
+def write_snapshot(path, data, images):
+    """Write a snapshot archive.
+
+    Args:
+        path (str): Destination file, replaced atomically
+        data (dict): JSON-serializable yearbook data, stored in the manifest
+        images (dict): Absolute image URL -> image bytes
+
+    Returns:
+        dict: The manifest that was written
+    """
+    manifest = dict(data, version=SNAPSHOT_VERSION, images={})
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(tmp, "w") as archive:
+        written = set()
+        for url, content in images.items():
+            if not content:
+                continue
+            digest = hashlib.sha256(content).hexdigest()
+            manifest["images"][url] = digest
+            if digest not in written:
+                # images are already compressed, deflating them again only costs time
+                archive.writestr(f"blobs/{digest}", content, compress_type=zipfile.ZIP_STORED)
+                written.add(digest)
+        archive.writestr("manifest.json", json.dumps(manifest), compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp, path)
+    return manifest
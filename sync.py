@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class SyncStore:
+    """Local record of the last response seen for every portal endpoint.
+
+    Keeps the body, its validators (ETag / Last-Modified) and the post IDs it
+    contained in a small sqlite database, so later runs can send conditional
+    requests and tell which posts are new.
+    """
+
+    def __init__(self, path):
+        """Open or create the store.
+
+        Args:
+            path (str): Path of the sqlite database
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # usually inside the image cache directory, which may not exist yet on a first run
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                digest TEXT,
+                body TEXT,
+                post_ids TEXT,
+                checked_at REAL
+            )""")
+        self._db.commit()
+
+    def get(self, url):
+        """Return the stored entry for ``url`` as a dict, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, digest, body, post_ids, checked_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, digest, body, post_ids, checked_at = row
+        return {"etag": etag, "last_modified": last_modified, "digest": digest, "body": body,
+                "post_ids": json.loads(post_ids), "checked_at": checked_at}
+
+    def put(self, url, etag, last_modified, body, post_ids):
+        """Store a fresh response for ``url``."""
+        digest = hashlib.sha256(body.encode()).hexdigest()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, digest, body, json.dumps(sorted(post_ids, key=str)), time.time()))
+            self._db.commit()
+
+    def touch(self, url):
+        """Mark the stored entry for ``url`` as revalidated now."""
+        with self._lock:
+            self._db.execute("UPDATE responses SET checked_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class SyncReport:
+    """What changed on the portal since the previous run."""
+
+    def __init__(self):
+        self.endpoints = {}  # path -> (status, added post IDs, removed post IDs)
+        self._lock = threading.Lock()
+
+    def record(self, path, status, added=(), removed=()):
+        with self._lock:
+            self.endpoints[path] = (status, list(added), list(removed))
+
+    def changed(self, path):
+        """Whether the response for ``path`` differed from the stored one."""
+        status = self.endpoints.get(path, ("new",))[0]
+        return status in ("new", "changed")
+
+    def summary(self):
+        """One line describing the delta, e.g. for printing at the end of a run."""
+        with self._lock:
+            counts = {}
+            added = removed = 0
+            for status, new_ids, gone_ids in self.endpoints.values():
+                counts[status] = counts.get(status, 0) + 1
+                added += len(new_ids)
+                removed += len(gone_ids)
+        statuses = ", ".join(f"{counts[s]} {s}" for s in ("new", "changed", "unchanged", "skipped") if s in counts)
+        return f"Sync: {statuses or 'nothing fetched'}; {added} new messages, {removed} removed"
+
+class IncrementalFetcher:
+    """JSON fetcher that only transfers what changed since the previous run.
+
+    Sends ``If-None-Match`` / ``If-Modified-Since`` with the validators from
+    the ``SyncStore`` and serves the stored body on ``304 Not Modified``.
+    Entries revalidated less than ``max_age`` seconds ago are served without
+    any request. Every fetch is recorded in ``report`` with the post IDs that
+    appeared or disappeared.
+    """
+
+    def __init__(self, transport, store, max_age=0):
+        """Initialize the fetcher.
+
+        Args:
+            transport (Transport): Transport used for the requests
+            store (SyncStore): Store holding the previous responses
+            max_age (float): Seconds a stored response is trusted without revalidating it
+        """
+        self.transport = transport
+        self.store = store
+        self.max_age = max_age
+        self.report = SyncReport()
+
+    def get_json(self, path):
+        """GET a JSON endpoint, raising ``requests.HTTPError`` on an error status."""
+        url = self.transport.url(path)
+        cached = self.store.get(url)
+        if cached is not None and self.max_age and time.time() - cached["checked_at"] < self.max_age:
+            self.report.record(path, "skipped")
+            return json.loads(cached["body"])
+
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.transport.request("GET", path, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self.store.touch(url)
+            self.report.record(path, "unchanged")
+            return json.loads(cached["body"])
+        response.raise_for_status()
+
+        body = response.text
+        data = json.loads(body)
+        ids = post_ids(data)
+        if cached is not None and cached["digest"] == hashlib.sha256(body.encode()).hexdigest():
+            # the portal ignored the validators but nothing changed
+            self.store.touch(url)
+            self.report.record(path, "unchanged")
+            return data
+
+        self.store.put(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), body, ids)
+        if cached is None:
+            self.report.record(path, "new", added=ids)
+        else:
+            old, new = set(cached["post_ids"]), set(ids)
+            self.report.record(path, "changed", added=[i for i in ids if i not in old],
+                               removed=[i for i in cached["post_ids"] if i not in new])
+        return data
+
+    def iter_json(self, path):
+        """Items of a JSON list; the store needs the whole body, so unlike ``Transport.iter_json`` it is not streamed."""
+        return iter(self.get_json(path))
+
+def post_ids(data):
+    """IDs of the posts in a ``posts/my`` or ``posts/others`` list, empty for other payloads."""
+    if not isinstance(data, list):
+        return []
+    return [post_id(post) for post in data]
+
+def post_id(post):
+    """ID of a post, a digest of the post itself if the portal did not send one."""
+    if isinstance(post, dict) and post.get("id") is not None:
+        return post["id"]
+    return hashlib.sha1(json.dumps(post, sort_keys=True).encode()).hexdigest()
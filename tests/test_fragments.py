@@ -0,0 +1,101 @@
+import io
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+from pypdf.generic import IndirectObject
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from assets import get_assets
+from fragments import merge_fragments, page_count
+
+def picture():
+    image = Image.new("RGB", (64, 48))
+    image.putdata([(x * 4, y * 5, (x + y) % 256) for y in range(48) for x in range(64)])
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def render(path, pages, subsets=None):
+    """Draw one page per text, with the same picture and Helvetica title on every page."""
+    assets = get_assets()
+    c = canvas.Canvas(str(path), pagesize=letter)
+    if subsets is not None:
+        assets.font.share(c._doc, subsets)
+    for text in pages:
+        c.setFont("Helvetica", 16)
+        c.drawString(72, 720, "Yearbook")
+        c.drawImage(ImageReader(io.BytesIO(picture())), 72, 600, 64, 48)
+        c.setFont(assets.font_name, 12)
+        c.drawString(72, 560, text)
+        c.showPage()
+    c.save()
+    return str(path)
+
+def objects(path, predicate):
+    """Numbers of the distinct objects reachable from the pages of a PDF that match ``predicate``."""
+    seen = {}
+
+    def walk(value):
+        if isinstance(value, IndirectObject):
+            if value.idnum in seen:
+                return
+            seen[value.idnum] = value = value.get_object()
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key != "/Parent":
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    for page in PdfReader(path).pages:
+        walk(page.indirect_reference)
+    return [number for number, obj in seen.items() if isinstance(obj, dict) and predicate(obj)]
+
+def texts(path):
+    return [page.extract_text() for page in PdfReader(path).pages]
+
+@pytest.fixture
+def streamed(tmp_path):
+    # fragments rendered one after the other with a shared numbering that grows as text comes in
+    subsets = get_assets().font_subsets()
+    pages = [["hello world", "abc"], ["hello ☺ world ♥", "abc ★"], ["zzz ✓ ☺ ♫"]]
+    fragments = [render(tmp_path / ("part%d.pdf" % i), part, subsets) for i, part in enumerate(pages)]
+    return fragments, [text for part in pages for text in part]
+
+def test_round_trip_keeps_pages_and_text(streamed, tmp_path):
+    fragments, pages = streamed
+    output = str(tmp_path / "book.pdf")
+    merge_fragments(fragments, output)
+
+    assert page_count(output) == sum(page_count(fragment) for fragment in fragments) == len(pages)
+    for text, expected in zip(texts(output), pages):
+        assert expected in text and "Yearbook" in text
+
+def test_identical_objects_are_written_once(streamed, tmp_path):
+    fragments, _ = streamed
+    output = str(tmp_path / "book.pdf")
+    merge_fragments(fragments, output)
+
+    assert len(objects(output, lambda obj: obj.get("/Subtype") == "/Image")) == 1
+    assert len(objects(output, lambda obj: obj.get("/BaseFont") == "/Helvetica")) == 1
+
+def test_nested_subsets_are_merged_into_one_font(streamed, tmp_path):
+    fragments, _ = streamed
+    output = str(tmp_path / "book.pdf")
+    merge_fragments(fragments, output)
+
+    def symbola(obj):
+        return obj.get("/Subtype") == "/TrueType" and "Symbola" in str(obj.get("/BaseFont"))
+
+    assert len(objects(fragments[-1], symbola)) == len(objects(output, symbola)) == 1
+
+def test_unrelated_fragments_keep_their_own_subsets(tmp_path):
+    fragments = [render(tmp_path / "a.pdf", ["hello"]), render(tmp_path / "b.pdf", ["★ world"])]
+    output = str(tmp_path / "book.pdf")
+    merge_fragments(fragments, output)
+
+    assert texts(output)[0].count("hello") == 1 and "★ world" in texts(output)[1]
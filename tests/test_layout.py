@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from assets import get_assets
+from layout import iter_blocks, lines_fitting, plan_blocks, wrap_text
+
+OPTIONS = dict(page_top=750, continuation_top=742, bottom=50, header_height=85, leading=12, gap=50, min_lines=3)
+
+def baselines(placement):
+    first = placement.y - OPTIONS["header_height"] if placement.header else placement.y
+    return [first - OPTIONS["leading"] * i for i in range(placement.end - placement.start)]
+
+def check_plan(line_counts, top):
+    placements = plan_blocks(line_counts, top, **OPTIONS)
+
+    # every line is placed exactly once, in order, and every block starts with its header
+    parts = {}
+    for placement in placements:
+        parts.setdefault(placement.index, []).append(placement)
+    assert sorted(parts) == list(range(len(line_counts)))
+    for index, block in parts.items():
+        assert block[0].header and not any(part.header for part in block[1:])
+        assert block[0].start == 0 and block[-1].end == line_counts[index]
+        assert all(a.end == b.start for a, b in zip(block, block[1:]))
+        assert all(a.page + 1 == b.page for a, b in zip(block, block[1:]))
+
+    # nothing is drawn below the bottom margin or above the top of its page
+    for placement in placements:
+        lines = baselines(placement)
+        assert not lines or lines[-1] >= OPTIONS["bottom"]
+        assert placement.y <= (top if placement.page == 0 else OPTIONS["page_top"])
+
+    # blocks on the same page do not overlap
+    pages = [placement.page for placement in placements]
+    assert pages == sorted(pages)
+    for a, b in zip(placements, placements[1:]):
+        if a.page == b.page:
+            last = baselines(a)[-1] if a.end > a.start else a.y - OPTIONS["header_height"]
+            assert b.y <= last - OPTIONS["gap"]
+
+    # a split block keeps at least min_lines lines with its header and on its last page
+    for block in parts.values():
+        if len(block) > 1:
+            assert block[0].end - block[0].start >= OPTIONS["min_lines"]
+            assert block[-1].end - block[-1].start >= OPTIONS["min_lines"]
+    return placements
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_plans_keep_invariants(seed):
+    rng = random.Random(seed)
+    counts = [rng.choice([0, 1, 2, 3, 4, 5, rng.randint(6, 60), rng.randint(60, 200)]) for _ in range(rng.randint(1, 30))]
+    top = rng.choice([OPTIONS["page_top"], rng.uniform(OPTIONS["bottom"], OPTIONS["page_top"]), rng.uniform(0, 200)])
+    check_plan(counts, top)
+
+def test_header_without_room_on_an_empty_page_moves_to_the_next_page():
+    placements = check_plan([120], 100)
+    assert placements[0].page == 1 and placements[0].y == OPTIONS["page_top"]
+
+def test_short_blocks_share_a_page():
+    placements = check_plan([2, 2, 2], OPTIONS["page_top"])
+    assert [placement.page for placement in placements] == [0, 0, 0]
+
+def test_iter_blocks_places_a_block_before_reading_the_next_count():
+    read = []
+
+    def counts():
+        for count in (5, 80, 5):
+            read.append(count)
+            yield count
+
+    for placement in iter_blocks(counts(), OPTIONS["page_top"], **OPTIONS):
+        # every part of block i is yielded while only i + 1 counts have been read
+        assert len(read) == placement.index + 1
+
+def test_lines_fitting():
+    assert lines_fitting(100, 50, 12) == 5
+    assert lines_fitting(50, 50, 12) == 1
+    assert lines_fitting(49, 50, 12) == 0
+
+@pytest.fixture(scope="module")
+def font():
+    return get_assets().font_name
+
+def test_wrap_text_keeps_every_word_within_the_width(font):
+    text = "memories of late nights in the hostel and the canteen " * 20 + "\n\n" + "x" * 400
+    layout = wrap_text(text, 300, font)
+    widths = get_assets().font.stringWidth
+    assert " ".join(layout.lines).split() == text.split()
+    # only a single word wider than the line may exceed it
+    assert all(widths(line, 12) <= 300 or " " not in line for line in layout.lines)
+    assert layout.height == len(layout.lines) * 12
+
+def test_wrap_text_skips_blank_paragraphs(font):
+    assert wrap_text("one\n\n  \ntwo", 300, font).lines == ["one", "two"]
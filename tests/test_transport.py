@@ -0,0 +1,68 @@
+import json
+import random
+
+import pytest
+
+from transport import iter_json_array
+
+ITEMS = [
+    {"id": 1, "content": "héllo wörld 🎓", "tags": ["a", "b"], "reply": None},
+    {"id": -12.5e3, "quote": "say \"hi\"\\n", "escaped": "é🎓"},
+    [1, [2, [3]], {}],
+    "plain",
+    12345,
+    -0.25,
+    True,
+    False,
+    None,
+    {"nested": {"deep": [{"x": "]"}, ","]}},
+]
+TEXT = json.dumps(ITEMS, ensure_ascii=False).encode("utf-8")
+
+def chunked(data, cuts):
+    cuts = [0] + sorted(cuts) + [len(data)]
+    return [data[a:b] for a, b in zip(cuts, cuts[1:])]
+
+@pytest.mark.parametrize("cut", range(len(TEXT) + 1))
+def test_every_split_point(cut):
+    assert list(iter_json_array(chunked(TEXT, [cut]))) == ITEMS
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_chunks(seed):
+    rng = random.Random(seed)
+    cuts = rng.sample(range(len(TEXT) + 1), rng.randint(1, 40))
+    assert list(iter_json_array(chunked(TEXT, cuts))) == ITEMS
+
+def test_one_byte_chunks():
+    assert list(iter_json_array(chunked(TEXT, range(len(TEXT))))) == ITEMS
+
+def test_compact_and_spaced_text():
+    for text in (json.dumps(ITEMS, separators=(",", ":")), json.dumps(ITEMS, indent=4)):
+        data = text.encode("utf-8")
+        assert list(iter_json_array(chunked(data, range(0, len(data), 3)))) == ITEMS
+
+def test_number_at_the_end_of_a_chunk_waits_for_its_digits():
+    assert list(iter_json_array([b"[12", b"34, 5", b"6]"])) == [1234, 56]
+    assert list(iter_json_array([b"[1.", b"5e", b"2]"])) == [150.0]
+
+def test_several_iterables_are_read_in_order():
+    assert list(iter_json_array([b"[1, ", b'"a'], iter([b'b", 2', b"]"]))) == [1, "ab", 2]
+
+def test_empty_array():
+    assert list(iter_json_array([b" [ ", b"] "])) == []
+
+def test_items_before_a_truncated_end_are_yielded():
+    items = iter_json_array([TEXT[:len(TEXT) // 2]])
+    assert next(items) == ITEMS[0]
+    with pytest.raises(ValueError):
+        list(items)
+
+@pytest.mark.parametrize("data", [b"", b"[", b'[1, "ab', b"[1, 2,"])
+def test_truncated_array(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array([data]))
+
+@pytest.mark.parametrize("data", [b'{"a": 1}', b"1", b'"[1]"'])
+def test_not_an_array(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array([data]))
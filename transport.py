@@ -0,0 +1,339 @@
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+import codecs
+import json
+import random
+import re
+import requests
+import threading
+import time
+
+PORTAL_URL = "https://yearbook.sarc-iitb.org"
+TOKEN_REFRESH_PATH = "/api/authenticate/token/refresh/"
+
+# statuses worth another attempt, anything else is returned to the caller as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# size of the pieces streamed responses are read in
+CHUNK_SIZE = 64 * 1024
+
+class RateLimiter:
+    """Spaces out requests so that no host sees more than ``rate`` requests per second."""
+
+    def __init__(self, rate):
+        """Initialize the limiter.
+
+        Args:
+            rate (float): Maximum requests per second per host, 0 or None disables limiting
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until a request to the host of ``url`` is allowed."""
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class Transport:
+    """Single HTTP layer for every call made to the yearbook portal.
+
+    Wraps a pooled ``requests.Session`` so connections are kept alive and
+    reused across calls and threads. Every request gets connect/read timeouts,
+    is throttled per host, and is retried with jittered exponential backoff on
+    connection errors and on the statuses in ``RETRY_STATUSES``. An expired
+    access token is renewed with the refresh token and the request repeated.
+    Latency and byte counts are accumulated per endpoint in ``stats``.
+
+    Passing ``adapter`` mounts a custom ``requests`` transport adapter for
+    ``base_url``, which lets a local fake portal stand in for the real one.
+    """
+
+    def __init__(self, base_url=PORTAL_URL, pool_size=8, connect_timeout=5.0, read_timeout=30.0,
+                 retries=3, backoff=0.5, rate=20.0, adapter=None):
+        """Initialize the transport.
+
+        Args:
+            base_url (str): Portal root that relative paths are resolved against
+            pool_size (int): Number of keep-alive connections, should match the crawl concurrency
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait between bytes of a response
+            retries (int): Number of retries for a failed request
+            backoff (float): Upper bound of the first retry delay in seconds, doubled for every further attempt
+            rate (float): Maximum requests per second per host
+            adapter (requests.adapters.BaseAdapter): Adapter to mount for ``base_url`` instead of the pooled HTTP one
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self.refresh_token = None
+        self._token_lock = threading.Lock()
+
+        self.session = requests.Session()
+        pooled = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size), max_retries=0)
+        self.session.mount("https://", pooled)
+        self.session.mount("http://", pooled)
+        if adapter is not None:
+            self.session.mount(self.base_url, adapter)
+
+    def set_token(self, access_token, refresh_token=None):
+        """Send ``access_token`` as a bearer token on every following request.
+
+        With ``refresh_token``, a request rejected with 401 gets a new access
+        token from ``TOKEN_REFRESH_PATH`` and is sent once more, so long runs
+        survive the access token expiring.
+        """
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+        self.refresh_token = refresh_token
+
+    def url(self, path):
+        """Resolve a portal-relative path to an absolute URL."""
+        return path if path.startswith(("http://", "https://")) else self.base_url + path
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying transient failures.
+
+        Args:
+            method (str): HTTP method
+            path (str): Portal-relative path or absolute URL
+            **kwargs: Passed on to ``requests.Session.request``; with ``stream=True`` the body is
+                left unread and not counted in ``stats``
+
+        Returns:
+            requests.Response: The last response received
+        """
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = _endpoint(url)
+        attempt = 0
+        renewed = False
+        while True:
+            self.limiter.wait(url)
+            start = time.perf_counter()
+            authorization = self.session.headers.get("Authorization")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(endpoint, time.perf_counter() - start, 0, failed=True)
+                if attempt >= self.retries:
+                    raise
+            else:
+                self._record(endpoint, time.perf_counter() - start, 0 if kwargs.get("stream") else len(response.content),
+                             failed=response.status_code >= 400)
+                if response.status_code == 401 and authorization and not renewed and self._renew_token(authorization):
+                    response.close()
+                    renewed = True
+                    self._record_retry(endpoint)
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                # hand the connection back to the pool before retrying
+                response.close()
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    time.sleep(int(retry_after))
+                    attempt += 1
+                    self._record_retry(endpoint)
+                    continue
+            # full jitter keeps the retries of many workers from lining up
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
+            self._record_retry(endpoint)
+
+    def _renew_token(self, authorization):
+        """Get a new access token after ``authorization`` was rejected, returns whether there is one."""
+        with self._token_lock:
+            if self.session.headers.get("Authorization") != authorization:
+                # another thread renewed it in the meantime
+                return True
+            if not self.refresh_token:
+                return False
+            url = self.url(TOKEN_REFRESH_PATH)
+            start = time.perf_counter()
+            try:
+                # the expired token is left out, the refresh token is the credential here
+                response = self.session.post(url, json={"refresh": self.refresh_token}, headers={"Authorization": None},
+                                             timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(_endpoint(url), time.perf_counter() - start, 0, failed=True)
+                return False
+            self._record(_endpoint(url), time.perf_counter() - start, len(response.content), failed=response.status_code >= 400)
+            if response.status_code != 200:
+                return False
+            tokens = response.json()
+            self.session.headers["Authorization"] = f"Bearer {tokens['access']}"
+            # the portal may rotate refresh tokens
+            self.refresh_token = tokens.get("refresh", self.refresh_token)
+            return True
+
+    def get_json(self, path):
+        """GET a JSON endpoint, raising ``requests.HTTPError`` on an error status."""
+        response = self.request("GET", path)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_json(self, path):
+        """GET a JSON list and yield its items as they arrive, raising ``requests.HTTPError`` on an error status.
+
+        A plain JSON array is parsed item by item while it downloads, so the
+        whole body is never held in memory. A paginated response
+        (``{"results": [...], "next": url}``) is read one page at a time,
+        following ``next`` until it is empty.
+        """
+        while path:
+            response = self.request("GET", path, stream=True)
+            endpoint = _endpoint(response.url or self.url(path))
+            chunks = _Counted(response.iter_content(CHUNK_SIZE))
+            path = None
+            try:
+                response.raise_for_status()
+                try:
+                    head = next(chunks)
+                    while not head.strip():
+                        head += next(chunks)
+                except StopIteration:
+                    raise ValueError(f"Empty response from {response.url}")
+                if head.lstrip()[:1] == b"[":
+                    yield from iter_json_array([head], chunks)
+                else:
+                    page = json.loads(head + b"".join(chunks))
+                    if not isinstance(page, dict) or not isinstance(page.get("results"), list):
+                        raise ValueError(f"Expected a list from {response.url}")
+                    yield from page["results"]
+                    path = page.get("next")
+            finally:
+                response.close()
+                self._record_bytes(endpoint, chunks.size)
+
+    def post_json(self, path, payload):
+        """POST a JSON payload and return the response."""
+        return self.request("POST", path, json=payload)
+
+    def get_bytes(self, path):
+        """GET raw bytes, raising ``requests.HTTPError`` on an error status."""
+        response = self.request("GET", path)
+        response.raise_for_status()
+        return response.content
+
+    def summary(self):
+        """Totals over all endpoints, as a dict."""
+        with self._stats_lock:
+            total = {"requests": 0, "failures": 0, "retries": 0, "bytes": 0, "seconds": 0.0}
+            for counters in self.stats.values():
+                for key in total:
+                    total[key] += counters[key]
+        return total
+
+    def stats_by_endpoint(self):
+        """A copy of ``stats``, endpoint -> counters."""
+        with self._stats_lock:
+            return {endpoint: dict(counters) for endpoint, counters in self.stats.items()}
+
+    def close(self):
+        self.session.close()
+
+    def _counters(self, endpoint):
+        counters = self.stats.get(endpoint)
+        if counters is None:
+            counters = self.stats[endpoint] = {"requests": 0, "failures": 0, "retries": 0, "bytes": 0,
+                                               "seconds": 0.0, "max_seconds": 0.0}
+        return counters
+
+    def _record(self, endpoint, seconds, size, failed):
+        with self._stats_lock:
+            counters = self._counters(endpoint)
+            counters["requests"] += 1
+            counters["failures"] += int(failed)
+            counters["bytes"] += size
+            counters["seconds"] += seconds
+            counters["max_seconds"] = max(counters["max_seconds"], seconds)
+
+    def _record_bytes(self, endpoint, size):
+        with self._stats_lock:
+            self._counters(endpoint)["bytes"] += size
+
+    def _record_retry(self, endpoint):
+        with self._stats_lock:
+            self._counters(endpoint)["retries"] += 1
+
+class _Counted:
+    """Iterator over byte chunks that adds up their length."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.size = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self.size += len(chunk)
+        return chunk
+
+_SEPARATORS = re.compile(r"[\s,]*")
+_ITEM_ENDS = (" ", "\t", "\r", "\n", ",", "]")
+
+def iter_json_array(*chunk_iterables):
+    """Yield the items of a JSON array whose UTF-8 text arrives in byte chunks.
+
+    Only the text of the items not yet parsed is buffered. An item split
+    across chunks is retried once more text has arrived.
+
+    Args:
+        *chunk_iterables: Iterables of byte chunks, read one after the other
+
+    Raises:
+        ValueError: If the text is not a JSON array or ends before the array is closed
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    opened = False
+    for chunks in chunk_iterables:
+        for chunk in chunks:
+            buffer += utf8.decode(chunk)
+            pos = 0
+            while True:
+                pos = _SEPARATORS.match(buffer, pos).end()
+                if pos == len(buffer):
+                    break
+                if not opened:
+                    if buffer[pos] != "[":
+                        raise ValueError("Expected a JSON array")
+                    opened = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # the item continues in the next chunk
+                    break
+                if not isinstance(item, (dict, list, str)) and buffer[end:end + 1] not in _ITEM_ENDS:
+                    # a number at the end of the chunk may continue in the next one
+                    break
+                yield item
+                pos = end
+            buffer = buffer[pos:]
+    raise ValueError("JSON array ended early")
+
+def _endpoint(url):
+    """Collapse a URL to the endpoint it hits, e.g. ``/api/posts/my/{id}`` or ``/media``."""
+    path = urlsplit(url).path
+    if not path.startswith("/api/"):
+        # images and other static files
+        return "/" + path.strip("/").split("/")[0]
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path.rstrip("/"))